@@ -0,0 +1,54 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# debounced move-alert e-mails for Straight_Gin_API
+#
+# A move only saves a PendingAlert for the game (with the Game, in its
+# transaction); one named task per user per alert window
+# (constants.MOVE_ALERT_WINDOW) sends all of the user's pending games as
+# a single digest when the window ends. Every move in the window tries to
+# add the same task name, so the taskqueue keeps only the first.
+
+import time
+import constants
+from google.appengine.api import taskqueue
+
+from models import PendingAlert
+
+
+def alert_window(now=None):
+    """ Return number of the alert window containing now """
+    return int(now or time.time()) // constants.MOVE_ALERT_WINDOW
+
+
+def alert_task_name(user, now=None):
+    """ Return name of user's alert task for window containing now """
+    return 'alert-%s-%d' % (user.urlsafe(), alert_window(now))
+
+
+def pending_alert(user, game):
+    """
+    Return PendingAlert that it became user's turn in game (put it with
+        the Game, so the alert is only kept if the move commits)
+    """
+    return PendingAlert(parent=game, id=alert_window(), user=user)
+
+
+def schedule_move_alert(user):
+    """
+    Queue digest of user's pending alerts for the end of the current
+        window (does nothing if already queued)
+    """
+    now = time.time()
+    countdown = constants.MOVE_ALERT_WINDOW - \
+        int(now) % constants.MOVE_ALERT_WINDOW
+    try:
+        taskqueue.add(url='/tasks/send_move_email',
+                      name=alert_task_name(user, now),
+                      countdown=countdown,
+                      params={'user_key': user.urlsafe(),
+                              'window': alert_window(now)})
+    except (taskqueue.TaskAlreadyExistsError,
+            taskqueue.TombstonedTaskError):
+        pass
+
@@ -5,39 +5,84 @@
 # API & basic game logic for Straight_Gin_API
 
 import logging
+import time
+import cards
+import constants
 import endpoints
+import game_cache
 import random
 
 from protorpc import remote, messages
 
 from google.appengine.api import memcache
-from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
-from models import User, Game, Score
+from models import User, UserName, Game, Move, Score, Leaderboard, \
+    normalize_name
 from models import UserForm, UserForms, NewGameForm, GameForm, GameForms, \
-    HandForm, GameHistoryForm, MoveForm, ScoreForm, ScoreForms, StringMessage
-from utils import get_by_urlsafe, deal_hand, pre_move_verification, \
-    game_exists, limit_set
+    HandForm, HandForms, GameHistoryForm, MoveForm, MakeMoveForm, TurnForm, \
+    ScoreForm, ScoreForms, RankForm, StringMessage
+from models.leaderboard import RANKINGS, SCORE_WINDOWS, score_board_name, \
+    entry_to_form
+from alerts import pending_alert, schedule_move_alert
+from instrumentation import instrumented
+from rules import TAKE_VISIBLE, TAKE_HIDDEN
+from utils import key_from_urlsafe, pre_move_verification, \
+    game_exists, limit_set, get_player_names, fetch_page, board_page
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(NewGameForm)
 GET_GAME_REQUEST = endpoints.ResourceContainer(
     urlsafe_game_key=messages.StringField(1))
+GET_GAME_VERSION_REQUEST = endpoints.ResourceContainer(
+    urlsafe_game_key=messages.StringField(1),
+    version=messages.IntegerField(2, required=False))
 GET_HAND_REQUEST = endpoints.ResourceContainer(
     urlsafe_game_key=messages.StringField(1),
     user_name=messages.StringField(2, required=False))
 HIGH_SCORES_REQUEST = endpoints.ResourceContainer(
-    number_of_results=messages.StringField(1, required=False))
+    number_of_results=messages.StringField(1, required=False),
+    page_size=messages.IntegerField(2, required=False),
+    page_token=messages.StringField(3, required=False),
+    window=messages.StringField(4, required=False))
+MAKE_MOVE_REQUEST = endpoints.ResourceContainer(
+    MakeMoveForm,
+    urlsafe_game_key=messages.StringField(1),)
 MOVE_REQUEST = endpoints.ResourceContainer(
     MoveForm,
     urlsafe_game_key=messages.StringField(1),)
+POLL_GAME_REQUEST = endpoints.ResourceContainer(
+    urlsafe_game_key=messages.StringField(1),
+    version=messages.IntegerField(2, required=True),
+    timeout=messages.IntegerField(3, required=False))
+PAGE_REQUEST = endpoints.ResourceContainer(
+    page_size=messages.IntegerField(1, required=False),
+    page_token=messages.StringField(2, required=False))
 USER_GAME_REQUEST = endpoints.ResourceContainer(
+    user_name=messages.StringField(1),
+    page_size=messages.IntegerField(2, required=False),
+    page_token=messages.StringField(3, required=False))
+USER_NAME_REQUEST = endpoints.ResourceContainer(
     user_name=messages.StringField(1))
+USER_RANK_REQUEST = endpoints.ResourceContainer(
+    user_name=messages.StringField(1),
+    board=messages.StringField(2, required=False))
 USER_REQUEST = endpoints.ResourceContainer(
     user_name=messages.StringField(1),
     email=messages.StringField(2))
 
 
+def read_game(key):
+    """
+    Return Game of key from the datastore (not game_cache), or None; in
+        a transaction, so concurrent moves can't both save the same version
+    Raises ValueError if the entity is of the incorrect kind
+    """
+    game = key.get()
+    if game is not None and not isinstance(game, Game):
+        raise ValueError('Incorrect Kind')
+    return game
+
+
 @endpoints.api(name='gin', version='v1')
 class StraightGinAPI(remote.Service):
     """ Game API """
@@ -47,14 +92,22 @@ class StraightGinAPI(remote.Service):
                       path='users',
                       name='create_user',
                       http_method='POST')
+    @instrumented
     def create_user(self, request):
         """ Create User with unique user_name """
-        # Check that user_name isn't already taken
-        if User.query(User.name == request.user_name).get():
+        # names can only be checked once every User is in the name index
+        if not UserName.index_complete_async().get_result():
+            raise endpoints.ForbiddenException(
+                'New users can be created once user names are migrated '
+                '(migrate_user_names).')
+        # Check that user_name isn't already taken (or reserved)
+        user = None
+        if normalize_name(request.user_name) != \
+                normalize_name(constants.COMPUTER_NAME):
+            user = User.create(request.user_name, request.email)
+        if not user:
             raise endpoints.ConflictException(
                     'User with that name already exists!')
-        user = User(name=request.user_name, email=request.email)
-        user.put()
         return StringMessage(message='User {} created!'.format(
                 request.user_name))
 
@@ -63,19 +116,31 @@ class StraightGinAPI(remote.Service):
                       path='games',
                       name='new_game',
                       http_method='POST')
+    @instrumented
     def new_game(self, request):
         """ Create new Game """
         # Make sure two players submitted in request exist
         if request.player_one == request.player_two:
                 raise endpoints.BadRequestException('Game must involve '
                                                     'two different players!')
-        player_one = User.query(User.name == request.player_one).get()
-        player_two = User.query(User.name == request.player_two).get()
+        # look up both players in parallel
+        # (computer opponent takes player_two's seat)
+        lookups = [User.by_name_async(request.player_one)]
+        if request.vs_computer:
+            lookups.append(User.computer_async())
+        else:
+            lookups.append(User.by_name_async(request.player_two))
+        player_one, player_two = [lookup.get_result() for lookup in lookups]
         if not player_one or not player_two:
             raise endpoints.NotFoundException(
                     'One of those users does not exist!')
+        # names differing only in case/spaces are the same user
+        if player_one.key == player_two.key:
+            raise endpoints.BadRequestException('Game must involve '
+                                                'two different players!')
         # Call new_game method
-        game = Game.new_game(player_one.key, player_two.key)
+        game = Game.new_game(player_one.key, player_two.key,
+                             vs_computer=bool(request.vs_computer))
         return game.game_to_form()
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
@@ -83,39 +148,87 @@ class StraightGinAPI(remote.Service):
                       path='games/{urlsafe_game_key}',
                       name='cancel_game',
                       http_method='DELETE')
+    @instrumented
     def cancel_game(self, request):
         """ Delete Game-in-progress """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        game = game_cache.get(request.urlsafe_game_key, Game)
         if game_exists(game):
             if game.game_over:
                 raise endpoints.BadRequestException('Game already over!')
             else:
-                game.key.delete()
+                # delete Game with its move log
+                moves = Move.log_query(game.key).fetch(keys_only=True)
+                ndb.delete_multi(moves + [game.key])
                 return StringMessage(message='Game deleted!')
 
-    @endpoints.method(request_message=GET_GAME_REQUEST,
+    @endpoints.method(request_message=GET_GAME_VERSION_REQUEST,
                       response_message=GameForm,
                       path='games/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @instrumented
     def get_game(self, request):
-        """ Return current Game state without revealing player hands """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        """
+        Return current Game state without revealing player hands
+        version: optional; if still the Game's version, returns a
+            not_modified GameForm (checked in memcache, so a client
+            polling an idle game causes no datastore reads)
+        """
+        urlsafe, version = request.urlsafe_game_key, request.version
+        if version is not None and \
+                game_cache.cached_version(urlsafe) == version:
+            return Game.not_modified_form(urlsafe, version)
+        game = game_cache.get(urlsafe, Game)
         if game_exists(game):
+            if game.version == version:
+                return Game.not_modified_form(urlsafe, version)
             return game.game_to_form()
 
+    @endpoints.method(request_message=POLL_GAME_REQUEST,
+                      response_message=GameForm,
+                      path='games/{urlsafe_game_key}/poll',
+                      name='poll_game',
+                      http_method='GET')
+    @instrumented
+    def poll_game(self, request):
+        """
+        Wait until Game's version is no longer version, then return its
+            state as get_game does; if it hasn't changed within timeout
+            seconds (at most constants.POLL_TIMEOUT), return a
+            not_modified GameForm
+        Waits on the version in memcache; the Game is only read once it
+            changed (or if memcache lost it)
+        """
+        urlsafe, version = request.urlsafe_game_key, request.version
+        timeout = constants.POLL_TIMEOUT
+        if request.timeout is not None:
+            if request.timeout < 0:
+                raise endpoints.BadRequestException('timeout must not '
+                                                    'be negative.')
+            timeout = min(request.timeout, timeout)
+        deadline = time.time() + timeout
+        while True:
+            if game_cache.cached_version(urlsafe) != version:
+                game = game_cache.get(urlsafe, Game)
+                if game_exists(game) and game.version != version:
+                    return game.game_to_form()
+            if time.time() >= deadline:
+                return Game.not_modified_form(urlsafe, version)
+            time.sleep(constants.POLL_INTERVAL)
+
     @endpoints.method(request_message=GET_HAND_REQUEST,
                       response_message=HandForm,
                       path='games/{urlsafe_game_key}/hand',
                       name='get_hand',
                       http_method='GET')
+    @instrumented
     def get_hand(self, request):
         """ Return hand of player by user_name;
         if no user_name, return active player's hand """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        game = game_cache.get(request.urlsafe_game_key, Game)
         if game_exists(game):
             # if user specified in request, return that player's hand
-            user = User.query(User.name == request.user_name).get()
+            user = User.by_name(request.user_name)
             if user:
                 return game.hand_to_form(user.name)
             # otherwise, return active player's hand (whose turn it is)
@@ -127,115 +240,160 @@ class StraightGinAPI(remote.Service):
                       path='games/{urlsafe_game_key}/start-move',
                       name='start_move',
                       http_method='PUT, POST')
+    @instrumented
     def start_move(self, request):
         """ Return mid_move Game state """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        user = User.query(User.name == request.user_name).get()
-        pre_move_verification(game, user)
-        if game.mid_move:
-            raise endpoints.BadRequestException(
-                'Game is mid-move. "get_hand", select discard,'
-                ' then "end_move".')
+        key = key_from_urlsafe(request.urlsafe_game_key)
+        user = User.by_name(request.user_name)
 
-        # get hand of current player
-        if game.active_player == game.player_one:
-            hand = game.hand_one
-        else:
-            hand = game.hand_two
-        # add requested card to player's hand & update deck (if needed)
-        move = request.move.strip()
-        text_move = ''
-        # if player takes visible draw_card, deck isn't affected
-        if move == '1':
-            hand += game.draw_card
-            text_move = 'took visible card ' + ''.join(game.draw_card)
-            game.history.append((user.name, text_move))
-            game.draw_card = ['']
-        # if player takes hidden card from deck, draw_card isn't affected
-        elif move == '2':
-            hidden_card, deck = deal_hand(1, game.deck)
-            # if there are still cards left in deck, play continues
-            if hidden_card is not None:
-                hand += hidden_card
-                text_move = 'took hidden card ' + ''.join(hidden_card)
-                game.history.append((user.name, text_move))
-                game.deck = deck
-            # but if out of cards, game automatically ends
-            else:
-                game.end_game(self)
-        # Handle bad input from user
-        else:
-            raise endpoints.BadRequestException(
-                'Invalid move! Enter 1 to take visible card'
-                ' or 2 to draw from pile.')
-        # reset flag
-        if not game.game_over:
-            game.mid_move = True
-            game.put()
-        return game.hand_to_form("not_given")
+        @ndb.transactional(xg=True)
+        def take():
+            """ Read, update and write Game once; return it """
+            game = read_game(key)
+            pre_move_verification(game, user)
+            if game.mid_move:
+                raise endpoints.BadRequestException(
+                    'Game is mid-move. "get_hand", select discard,'
+                    ' then "end_move".')
+
+            # add requested card to player's hand & update deck (if needed)
+            move = request.move.strip()
+            # Handle bad input from user
+            if move not in (TAKE_VISIBLE, TAKE_HIDDEN):
+                raise endpoints.BadRequestException(
+                    'Invalid move! Enter 1 to take visible card'
+                    ' or 2 to draw from pile.')
+            # if deck is out of cards, game automatically ends (and is saved)
+            game.take_card(move)
+            if not game.game_over:
+                game.put()
+            return game
+
+        # the active player is the user, whose name is known
+        return take().hand_to_form("not_given", {user.key: user.name})
 
     @endpoints.method(request_message=MOVE_REQUEST,
                       response_message=GameForm,
                       path='games/{urlsafe_game_key}/end-move',
                       name='end_move',
                       http_method='PUT, POST')
+    @instrumented
     def end_move(self, request):
         """ Return Game state when player completes a move """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        user = User.query(User.name == request.user_name).get()
-        pre_move_verification(game, user)
-        if not game.mid_move:
-            raise endpoints.BadRequestException(
-                'You must "start_move" before you end it! Try "get_hand"'
-                ' to see active_player hand and instructions for next move.')
+        key = key_from_urlsafe(request.urlsafe_game_key)
+        user = User.by_name(request.user_name)
 
-        # get hand of current player
-        if game.active_player == game.player_one:
-            hand = game.hand_one
-        else:
-            hand = game.hand_two
-        move = request.move.split()
-        # verify user input
-        if not move[0] in hand:
-            raise endpoints.BadRequestException(
-                'That card is not in your hand! Enter your discard. If you'
-                ' are ready to go out, also type OUT. Example: D-K OUT')
-        # remove discard from hand and set as draw_card
-        else:
-            hand.remove(move[0])
-            game.draw_card = []
-            game.draw_card.append(''.join(move[0]))
-            text_move = 'discards %s' % move[0]
-            game.history.append((user.name, text_move))
+        @ndb.transactional(xg=True)
+        def discard():
+            """ Read, update and write Game once; return it """
+            game = read_game(key)
+            pre_move_verification(game, user)
+            if not game.mid_move:
+                raise endpoints.BadRequestException(
+                    'You must "start_move" before you end it! Try'
+                    ' "get_hand" to see active_player hand and instructions'
+                    ' for next move.')
 
+            move = request.move.split()
+            try:
+                card = cards.str_to_card(move[0])
+            except (ValueError, IndexError):
+                card = None
+            # verify user input
+            if card is None or not game.active_hand() >> card & 1:
+                raise endpoints.BadRequestException(
+                    'That card is not in your hand! Enter your discard. If'
+                    ' you are ready to go out, also type OUT. Example: D-K'
+                    ' OUT')
             # if player chooses to go "OUT", end game
-            if len(move) == 2:
-                if move[1] == 'OUT' or move[1] == 'out':
-                    game.end_game(True)
-            # other input from user is ignored
+            # (other input from user is ignored)
+            out = len(move) == 2 and move[1] in ('OUT', 'out')
+            game.discard_card(card, out)
 
-            # reset flags
+            # computer opponent plays its turn right away
+            if game.computer_to_move():
+                game.play_computer_turn()
             if not game.game_over:
-                if game.active_player == game.player_one:
-                    game.active_player = game.player_two
-                elif game.active_player == game.player_two:
-                    game.active_player = game.player_one
-                game.mid_move = False
-                game.put()
-                # send e-mail reminder
-                taskqueue.add(url='/tasks/send_move_email',
-                              params={'user_key': game.active_player.urlsafe(),
-                                      'game_key': game.key.urlsafe()})
-            return game.game_to_form()
+                # send e-mail reminder, only if move commits (computer
+                # opponent's moves are already in this response)
+                if game.vs_computer:
+                    game.put()
+                else:
+                    ndb.put_multi([game, pending_alert(game.active_player,
+                                                       game.key)])
+            return game
+
+        game = discard()
+        if not game.game_over and not game.vs_computer:
+            schedule_move_alert(game.active_player)
+        return game.game_to_form()
+
+    @endpoints.method(request_message=MAKE_MOVE_REQUEST,
+                      response_message=TurnForm,
+                      path='games/{urlsafe_game_key}/move',
+                      name='make_move',
+                      http_method='PUT, POST')
+    @instrumented
+    def make_move(self, request):
+        """ Play a whole turn (start_move + end_move) in one request """
+        key = key_from_urlsafe(request.urlsafe_game_key)
+        user = User.by_name(request.user_name)
+        # verify user input before touching the game
+        draw = request.draw.strip()
+        if draw not in (TAKE_VISIBLE, TAKE_HIDDEN):
+            raise endpoints.BadRequestException(
+                'Invalid draw! Enter 1 to take visible card'
+                ' or 2 to draw from pile.')
+        try:
+            discard = cards.str_to_card(request.discard)
+        except ValueError:
+            raise endpoints.BadRequestException(
+                'Invalid discard! Enter a card, i.e. D-K')
+
+        @ndb.transactional(xg=True)
+        def play_turn():
+            """ Read, update and write Game once; return (game, drawn) """
+            game = read_game(key)
+            pre_move_verification(game, user)
+            if game.mid_move:
+                raise endpoints.BadRequestException(
+                    'Game is mid-move. "get_hand", select discard,'
+                    ' then "end_move".')
+            # if deck is out of cards, game automatically ends (and is saved)
+            drawn = game.take_card(draw)
+            if game.game_over:
+                return game, drawn
+            if not game.active_hand() >> discard & 1:
+                raise endpoints.BadRequestException(
+                    'That card is not in your hand!')
+            game.discard_card(discard, request.out)
+            # computer opponent plays its turn right away
+            if game.computer_to_move():
+                game.play_computer_turn()
+            if not game.game_over:
+                # send e-mail reminder, only if turn commits
+                if game.vs_computer:
+                    game.put()
+                else:
+                    ndb.put_multi([game, pending_alert(game.active_player,
+                                                       game.key)])
+            return game, drawn
+
+        game, drawn = play_turn()
+        if not game.game_over and not game.vs_computer:
+            schedule_move_alert(game.active_player)
+        return TurnForm(drawn_card=cards.mask_to_text(drawn or 0),
+                        game=game.game_to_form())
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=GameHistoryForm,
                       path='games/{urlsafe_game_key}/history',
                       name='get_game_history',
                       http_method='GET')
+    @instrumented
     def get_game_history(self, request):
         """ Return history of a Game """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        game = game_cache.get(request.urlsafe_game_key, Game)
         if game_exists(game):
             return game.history_to_form()
 
@@ -244,9 +402,10 @@ class StraightGinAPI(remote.Service):
                       path='games/{urlsafe_game_key}/score',
                       name='get_game_score',
                       http_method='GET')
+    @instrumented
     def get_game_score(self, request):
         """ Return Score associated with a Game """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        game = game_cache.get(request.urlsafe_game_key, Game)
         if game_exists(game):
             if game.game_over:
                 score = Score.query(Score.game == game.key).get()
@@ -260,67 +419,182 @@ class StraightGinAPI(remote.Service):
                       path='users/{user_name}/games',
                       name='get_user_games',
                       http_method='GET')
+    @instrumented
     def get_user_games(self, request):
-        """ Return all of an individual User's games,
+        """ Return a page of an individual User's games,
             in progress and complete """
-        user = User.query(User.name == request.user_name).get()
+        user = User.by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'User with that name does not exist!')
         # Get all games, then order with !game_over first
-        q = user.all_games()
-        games = q.order(Game.game_over)
-        return GameForms(items=[game.game_to_form() for game in games])
+        q = user.all_games().order(Game.game_over)
+        games, next_page_token = fetch_page(q, request.page_size,
+                                            request.page_token)
+        # look up every player name in one batch
+        names = get_player_names(games, {user.key: user.name})
+        return GameForms(items=[game.game_to_form(names) for game in games],
+                         next_page_token=next_page_token)
+
+    @endpoints.method(request_message=USER_NAME_REQUEST,
+                      response_message=HandForms,
+                      path='users/{user_name}/active-games',
+                      name='get_active_games',
+                      http_method='GET')
+    @instrumented
+    def get_active_games(self, request):
+        """ Return User's hand in each of User's games in progress """
+        user = User.by_name(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                    'User with that name does not exist!')
+        # keys from the players index, then every game in one batch (the
+        # query is eventually consistent, the gets aren't), then every
+        # player name in another
+        keys = Game.query(Game.players == user.key,
+                          Game.game_over == False).fetch(keys_only=True)
+        games = [game for game in ndb.get_multi(keys)
+                 if game is not None and not game.game_over]
+        names = get_player_names(games, {user.key: user.name})
+        return HandForms(items=[game.hand_to_form(user.name, names)
+                                for game in games])
 
-    @endpoints.method(response_message=ScoreForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @instrumented
     def get_scores(self, request):
-        """ Return all Scores in database """
-        return ScoreForms(items=[score.score_to_form()
-                          for score in Score.query()])
+        """ Return a page of Scores in database """
+        scores, next_page_token = fetch_page(Score.query(), request.page_size,
+                                             request.page_token,
+                                             projection=Score.FORM_FIELDS)
+        names = get_player_names(scores)
+        return ScoreForms(items=[score.score_to_form(names)
+                          for score in scores],
+                          next_page_token=next_page_token)
 
     @endpoints.method(request_message=USER_GAME_REQUEST,
                       response_message=ScoreForms,
                       path='users/{user_name}/scores',
                       name='get_user_scores',
                       http_method='GET')
+    @instrumented
     def get_user_scores(self, request):
-        """ Return all of an individual User's scores """
-        user = User.query(User.name == request.user_name).get()
+        """ Return a page of an individual User's scores """
+        user = User.by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'User with that name does not exist!')
         # Get all scores, then order by lowest winner-penalty first
-        q = user.all_scores()
-        scores = q.order(Score.penalty_winner)
-        return ScoreForms(items=[score.score_to_form() for score in scores])
+        q = user.all_scores().order(Score.penalty_winner)
+        scores, next_page_token = fetch_page(q, request.page_size,
+                                             request.page_token)
+        names = get_player_names(scores, {user.key: user.name})
+        return ScoreForms(items=[score.score_to_form(names)
+                                 for score in scores],
+                          next_page_token=next_page_token)
 
-    @endpoints.method(response_message=UserForms,
+    @endpoints.method(request_message=USER_NAME_REQUEST,
+                      response_message=UserForm,
+                      path='users/{user_name}/stats',
+                      name='get_user_stats',
+                      http_method='GET')
+    @instrumented
+    def get_user_stats(self, request):
+        """ Return User with current total_games and win_rate """
+        user = User.by_name(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                    'User with that name does not exist!')
+        return user.user_to_form(live=True)
+
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=UserForms,
                       path='users/rankings',
                       name='get_user_rankings',
                       http_method='GET')
+    @instrumented
     def get_user_rankings(self, request):
-        """ Return Users ranked by win_rate """
-        q = User.query()
-        users = q.order(-User.win_rate)
-        return UserForms(items=[user.user_to_form() for user in users])
+        """ Return a page of Users ranked by win_rate """
+        # top of rankings comes from the board (one entity), rest from query
+        board = Leaderboard.get_board(RANKINGS)
+        users, next_page_token = board_page(board.entries,
+                                            board.rest_query(),
+                                            board.key_field(),
+                                            request.page_size,
+                                            request.page_token,
+                                            projection=User.FORM_FIELDS)
+        return UserForms(items=[user.user_to_form()
+                                if isinstance(user, User)
+                                else entry_to_form(user) for user in users],
+                         next_page_token=next_page_token)
 
     @endpoints.method(request_message=HIGH_SCORES_REQUEST,
                       response_message=ScoreForms,
                       path='scores/high_scores',
                       name='get_high_scores',
                       http_method='GET')
+    @instrumented
     def get_high_scores(self, request):
-        """ Return Scores ranked by lowest winner penalty """
-        q = Score.query()
-        if request.number_of_results:
+        """
+        Return a page of Scores ranked by lowest winner penalty
+        window: 'all' (default), or 'day'/'week' for today's/this week's
+        """
+        window = request.window or 'all'
+        if window not in SCORE_WINDOWS:
+            raise endpoints.BadRequestException(
+                'Window must be one of: ' + ', '.join(SCORE_WINDOWS))
+        page_size = request.page_size
+        # number_of_results (older clients) sets the size of first page
+        if request.number_of_results and page_size is None:
             if limit_set(request.number_of_results):
-                limit = int(request.number_of_results)
-                scores = q.order(Score.penalty_winner).fetch(limit=limit)
-        else:
-            scores = q.order(Score.penalty_winner)
-        return ScoreForms(items=[score.score_to_form() for score in scores])
+                page_size = int(request.number_of_results)
+        # top Scores come from the board; only all-time continues by query
+        board = Leaderboard.get_board(score_board_name(window))
+        scores, next_page_token = board_page(board.entries,
+                                             board.rest_query(),
+                                             board.key_field(), page_size,
+                                             request.page_token,
+                                             projection=Score.FORM_FIELDS)
+        names = get_player_names([score for score in scores
+                                  if isinstance(score, Score)])
+        return ScoreForms(items=[score.score_to_form(names)
+                                 if isinstance(score, Score)
+                                 else entry_to_form(score)
+                                 for score in scores],
+                          next_page_token=next_page_token)
+
+    @endpoints.method(request_message=USER_RANK_REQUEST,
+                      response_message=RankForm,
+                      path='users/{user_name}/rank',
+                      name='get_user_rank',
+                      http_method='GET')
+    @instrumented
+    def get_user_rank(self, request):
+        """
+        Return User's rank on a leaderboard (no rank if not in its top)
+        board: 'rankings' (default, by win_rate), or a high score window
+            ('all', 'day', 'week'), ranked by User's best Score as winner
+        """
+        user = User.by_name(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                    'User with that name does not exist!')
+        board = request.board or RANKINGS
+        if board == RANKINGS:
+            rank, entry = Leaderboard.get_board(RANKINGS).rank_of(
+                'user', user.key.urlsafe())
+            return RankForm(user_name=user.name, board=board, rank=rank,
+                            win_rate=entry and entry['win_rate'])
+        if board not in SCORE_WINDOWS:
+            raise endpoints.BadRequestException(
+                'Board must be one of: ' +
+                ', '.join((RANKINGS,) + SCORE_WINDOWS))
+        rank, entry = Leaderboard.get_board(score_board_name(board)).rank_of(
+            'winner', user.name)
+        return RankForm(user_name=user.name, board=board, rank=rank,
+                        penalty_winner=entry and entry['penalty_winner'])
 
 api = endpoints.api_server([StraightGinAPI])
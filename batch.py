@@ -0,0 +1,183 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# vectorized batch hand evaluator for Straight_Gin_API (requires NumPy)
+#
+# Scores many hands at once for analytics and simulation jobs. Gives the
+# same penalty as utils.test_hand (melds.deadwood), but splits the search
+# so it can run on whole arrays:
+#   - runs never cross suits, so the best run coverage of each suit is
+#     looked up in a 2**13 table indexed by the suit's rank mask
+#   - sets only matter for numbers held 3+ times (at most 3 in an 11-card
+#     hand), so every way of using those numbers as sets is tried and the
+#     best total coverage kept
+#
+# Run "python batch.py" to check against melds.deadwood on random hands
+# and report hands/sec.
+
+import numpy as np
+from itertools import product
+
+from cards import SUITS, RANKS, DECK_SIZE, SUIT_MASK
+
+CHUNK_SIZE = 1 << 16
+
+
+def _build_suit_tables():
+    """
+    Return (value, run_cover) tables indexed by 13-bit rank mask:
+        value: total penalty points of the ranks in mask
+        run_cover: most points coverable by disjoint runs within mask
+    """
+    size = 1 << RANKS
+    value = [0] * size
+    cover = [0] * size
+    for mask in xrange(1, size):
+        low = mask & -mask
+        rank = low.bit_length() - 1
+        value[mask] = value[mask ^ low] + rank + 1
+        # lowest rank left out of any run...
+        best = cover[mask ^ low]
+        # ...or starting a run of 3+ ranks
+        run = low
+        points = rank + 1
+        for length in xrange(2, RANKS - rank + 1):
+            run |= low << (length - 1)
+            points += rank + length
+            if run & mask != run:
+                break
+            if length >= 3 and points + cover[mask ^ run] > best:
+                best = points + cover[mask ^ run]
+        cover[mask] = best
+    return np.array(value, dtype=np.int32), np.array(cover, dtype=np.int32)
+
+SUIT_VALUE, RUN_COVER = _build_suit_tables()
+
+
+def _build_set_options():
+    """
+    Return (options, count) tables indexed by 4-bit mask of suits holding
+        one number: options[p, i] is the i-th choice of suits used as a
+        set (0 = no set); count[p] is the number of choices
+    """
+    options = np.zeros((16, 6), dtype=np.int64)
+    count = np.ones(16, dtype=np.int64)
+    for present in xrange(16):
+        suits = [1 << s for s in xrange(len(SUITS)) if present >> s & 1]
+        choices = [0]
+        if len(suits) >= 3:
+            choices.append(present)
+        if len(suits) == 4:
+            choices.extend(present ^ suit for suit in suits)
+        options[present, :len(choices)] = choices
+        count[present] = len(choices)
+    return options, count
+
+SET_OPTIONS, SET_OPTION_COUNT = _build_set_options()
+POPCOUNT4 = np.array([bin(i).count('1') for i in xrange(16)], dtype=np.int64)
+
+
+def batch_test_hand(hands):
+    """
+    Calculate deadwood penalties of many Straight_Gin hands
+    hands: (N, 52) boolean array (column = card int, see cards.py)
+        or length-N array of card masks
+    Return length-N int array of penalties (as utils.test_hand)
+    """
+    hands = np.asarray(hands)
+    if hands.dtype == np.bool_:
+        if hands.ndim != 2 or hands.shape[1] != DECK_SIZE:
+            raise ValueError('Expected (N, %d) boolean array' % DECK_SIZE)
+        to_suits = _suits_from_bools
+    else:
+        hands = hands.astype(np.uint64).ravel()
+        to_suits = _suits_from_masks
+    penalties = np.empty(len(hands), dtype=np.int32)
+    for start in xrange(0, len(hands), CHUNK_SIZE):
+        chunk = hands[start:start + CHUNK_SIZE]
+        penalties[start:start + len(chunk)] = _evaluate(to_suits(chunk))
+    return penalties
+
+
+def _suits_from_masks(masks):
+    """ Return (4, n) array of 13-bit rank masks, one row per suit """
+    return np.array([(masks >> np.uint64(s * RANKS)) & np.uint64(SUIT_MASK)
+                     for s in xrange(len(SUITS))], dtype=np.int64)
+
+
+def _suits_from_bools(bools):
+    """ Return (4, n) array of 13-bit rank masks, one row per suit """
+    weights = 1 << np.arange(RANKS, dtype=np.int64)
+    return np.array([np.dot(bools[:, s * RANKS:(s + 1) * RANKS], weights)
+                     for s in xrange(len(SUITS))], dtype=np.int64)
+
+
+def _evaluate(suits):
+    """ Return deadwood penalties of hands given as (4, n) suit masks """
+    n = suits.shape[1]
+    total = SUIT_VALUE[suits].sum(axis=0)
+    best = RUN_COVER[suits].sum(axis=0)
+
+    # 4-bit mask of suits holding each number, per hand: (13, n)
+    present = np.zeros((RANKS, n), dtype=np.int64)
+    for s in xrange(len(SUITS)):
+        for rank in xrange(RANKS):
+            present[rank] |= ((suits[s] >> rank) & 1) << s
+    eligible = POPCOUNT4[present] >= 3
+    slots = int(eligible.sum(axis=0).max()) if n else 0
+    if slots == 0:
+        return total - best
+
+    # numbers that could form sets, in slots: (slots, n)
+    columns = np.arange(n)
+    slot_rank = np.argsort(~eligible, axis=0, kind='mergesort')[:slots]
+    slot_present = present[slot_rank, columns]
+    slot_present[~eligible[slot_rank, columns]] = 0
+    slot_count = SET_OPTION_COUNT[slot_present]
+
+    # try each combination of set choices on the hands that allow it
+    for choice in product(xrange(6), repeat=slots):
+        if not any(choice):
+            continue
+        allowed = np.ones(n, dtype=np.bool_)
+        for k, option in enumerate(choice):
+            allowed &= slot_count[k] > option
+        idx = np.nonzero(allowed)[0]
+        if not len(idx):
+            continue
+        covered = np.zeros(len(idx), dtype=np.int64)
+        removed = np.zeros((len(SUITS), len(idx)), dtype=np.int64)
+        for k, option in enumerate(choice):
+            used = SET_OPTIONS[slot_present[k, idx], option]
+            rank = slot_rank[k, idx]
+            covered += POPCOUNT4[used] * (rank + 1)
+            for s in xrange(len(SUITS)):
+                removed[s] |= ((used >> s) & 1) << rank
+        for s in xrange(len(SUITS)):
+            covered += RUN_COVER[suits[s, idx] & ~removed[s]]
+        best[idx] = np.maximum(best[idx], covered)
+    return total - best
+
+
+if __name__ == '__main__':
+    import random
+    import time
+    import melds
+
+    rng = random.Random(0)
+    sample = [sum(1 << c for c in rng.sample(xrange(DECK_SIZE), size))
+              for size in (10, 11) * 5000]
+    expected = np.array([melds.deadwood(hand) for hand in sample])
+    mismatches = np.count_nonzero(batch_test_hand(sample) != expected)
+    print 'checked %d hands against melds.deadwood: %d mismatches' % (
+        len(sample), mismatches)
+
+    deck = np.arange(DECK_SIZE)
+    bools = np.zeros((1000000, DECK_SIZE), dtype=np.bool_)
+    for row in bools:
+        row[np.random.permutation(deck)[:10]] = True
+    start = time.time()
+    batch_test_hand(bools)
+    elapsed = time.time() - start
+    print '%d hands in %.2fs (%d hands/sec)' % (
+        len(bools), elapsed, len(bools) / elapsed)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# benchmarks for the hand engine and API flows of Straight_Gin_API
+#
+# Engine functions (utils.test_hand, clean_hand, group_consecutives,
+# check_sets, deal_hand) run over seeded random hands of several sizes.
+# API flows call StraightGinAPI methods directly against App Engine
+# testbed stubs (local datastore, memcache, taskqueue, mail; see
+# testing.py), so the SDK must be available (--sdk or APPENGINE_SDK).
+# Results are written as JSON; with --baseline, each result is compared
+# with the same result of an earlier run, and the exit status is 1 if any
+# is slower by more than --threshold.
+#
+# Example:
+#   python benchmark.py --sdk ~/google_appengine --out bench.json
+#   python benchmark.py --sdk ~/google_appengine --baseline bench.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from testing import setup_sdk, start_testbed
+
+HAND_SIZES = (7, 10, 13, 20)
+
+
+def best_time(name, size, calls, run, repeat):
+    """
+    Return result dict of the fastest of "repeat" runs
+    run: callable making "calls" calls of the benchmarked function
+    """
+    best = None
+    for _ in xrange(repeat):
+        started = time.time()
+        run()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {'name': name,
+            'size': size,
+            'calls': calls,
+            'seconds': round(best, 6),
+            'us_per_call': round(best / calls * 1e6, 3)}
+
+
+def call_each(func, inputs):
+    """ Return callable that calls func once per tuple of inputs """
+    def run():
+        for args in inputs:
+            func(*args)
+    return run
+
+
+def seeded_hands(size, count, seed):
+    """ Return "count" random hands (card masks) of "size" cards """
+    import cards
+    rng = random.Random((seed << 32) + size)
+    deck = range(cards.DECK_SIZE)
+    return [cards.cards_to_mask(rng.sample(deck, size))
+            for _ in xrange(count)]
+
+
+def engine_benchmarks(count, repeat, seed):
+    """ Return results of hand engine functions for each hand size """
+    import cards
+    import utils
+
+    def check_sets(leftovers, long_runs):
+        # check_sets changes its arguments, so each call gets copies
+        utils.check_sets(list(leftovers), [list(run) for run in long_runs])
+
+    def cold_test_hand():
+        utils.HAND_CACHE.clear()
+        for hand in hands:
+            utils.test_hand(hand)
+
+    def deal_hands():
+        random.seed(seed)
+        for _ in xrange(count):
+            utils.deal_hand(size, cards.FULL_DECK_MASK)
+
+    results = []
+    for size in HAND_SIZES:
+        hands = seeded_hands(size, count, seed)
+        suits = [utils.clean_hand(hand) for hand in hands]
+        # inputs of check_sets as greedy_test_hand would pass them
+        sets_inputs = [
+            ([rank for suit in hand_suits for rank in suit],
+             [group for suit in hand_suits
+              for group in utils.group_consecutives(suit)
+              if len(group) > 3])
+            for hand_suits in suits]
+
+        results.append(best_time('test_hand.cold', size, count,
+                                 cold_test_hand, repeat))
+        # HAND_CACHE is now filled with every hand
+        results.append(best_time('test_hand.cached', size, count,
+                                 call_each(utils.test_hand,
+                                           [(hand,) for hand in hands]),
+                                 repeat))
+        results.append(best_time('greedy_test_hand', size, count,
+                                 call_each(utils.greedy_test_hand,
+                                           [(hand,) for hand in hands]),
+                                 repeat))
+        results.append(best_time('clean_hand', size, count,
+                                 call_each(utils.clean_hand,
+                                           [(hand,) for hand in hands]),
+                                 repeat))
+        results.append(best_time('group_consecutives', size,
+                                 count * len(cards.SUITS),
+                                 call_each(utils.group_consecutives,
+                                           [(suit,) for hand_suits in suits
+                                            for suit in hand_suits]),
+                                 repeat))
+        results.append(best_time('check_sets', size, count,
+                                 call_each(check_sets, sets_inputs), repeat))
+        results.append(best_time('deal_hand', size, count, deal_hands,
+                                 repeat))
+    return results
+
+
+class EndpointTimer(object):
+    """ Times StraightGinAPI calls, grouped by endpoint name """
+    def __init__(self):
+        self.samples = {}
+
+    def call(self, name, method, request):
+        """ Return method(request); each call starts like a new request """
+        from google.appengine.ext import ndb
+        ndb.get_context().clear_cache()
+        started = time.time()
+        try:
+            return method(request)
+        finally:
+            self.samples.setdefault(name, []).append(time.time() - started)
+
+    def results(self, size):
+        """ Return result dict per endpoint (size: flow parameter) """
+        results = []
+        for name, samples in sorted(self.samples.iteritems()):
+            samples = sorted(samples)
+            total = sum(samples)
+            results.append({'name': 'api.' + name,
+                            'size': size,
+                            'calls': len(samples),
+                            'seconds': round(total, 6),
+                            'us_per_call': round(total / len(samples) * 1e6,
+                                                 3),
+                            'p50_ms': round(samples[len(samples) // 2] * 1e3,
+                                            3),
+                            'max_ms': round(samples[-1] * 1e3, 3)})
+        return results
+
+
+def api_benchmarks(games, turns, seed):
+    """
+    Return results of API flows: new_game, start_move/end_move loops
+        over the first "turns" turns of each game, get_hand, and paging
+        through get_user_games of a user with "games" games (twice:
+        endpoint games plus seeded games)
+    """
+    bed = start_testbed()
+    try:
+        import cards
+        import computer
+        import constants
+        from api import StraightGinAPI, USER_REQUEST, NEW_GAME_REQUEST, \
+            GET_HAND_REQUEST, MOVE_REQUEST, USER_GAME_REQUEST
+        from google.appengine.ext import ndb
+        from models import User, Game
+        from rules import TAKE_HIDDEN
+
+        api = StraightGinAPI()
+        timer = EndpointTimer()
+        names = ('bench-one', 'bench-two')
+        for name in names:
+            timer.call('create_user', api.create_user,
+                       USER_REQUEST.combined_message_class(
+                           user_name=name, email=name + '@example.com'))
+
+        for _ in xrange(games):
+            timer.call('new_game', api.new_game,
+                       NEW_GAME_REQUEST.combined_message_class(
+                           player_one=names[0], player_two=names[1]))
+
+        # new_game deals from a random seed, so games played below are
+        # created with seeds from the benchmark seed instead
+        rng = random.Random(seed)
+        players = [User.by_name(name).key for name in names]
+        keys = [Game.new_game(players[0], players[1],
+                              seed=rng.getrandbits(32)).key
+                for _ in xrange(games)]
+        for key in keys:
+            for _ in xrange(turns):
+                game = key.get()
+                if game.game_over:
+                    break
+                name = names[players.index(game.active_player)]
+                urlsafe = key.urlsafe()
+                timer.call('get_hand', api.get_hand,
+                           GET_HAND_REQUEST.combined_message_class(
+                               urlsafe_game_key=urlsafe, user_name=name))
+                timer.call('start_move', api.start_move,
+                           MOVE_REQUEST.combined_message_class(
+                               urlsafe_game_key=urlsafe, user_name=name,
+                               move=TAKE_HIDDEN))
+                ndb.get_context().clear_cache()
+                game = key.get()
+                if game.game_over:
+                    break
+                card, _ = computer.choose_discard(game.active_hand())
+                timer.call('end_move', api.end_move,
+                           MOVE_REQUEST.combined_message_class(
+                               urlsafe_game_key=urlsafe, user_name=name,
+                               move=cards.card_to_str(card)))
+
+        page_token = None
+        while True:
+            form = timer.call('get_user_games', api.get_user_games,
+                              USER_GAME_REQUEST.combined_message_class(
+                                  user_name=names[0],
+                                  page_size=constants.MAX_PAGE_SIZE,
+                                  page_token=page_token))
+            page_token = form.next_page_token
+            if not page_token:
+                break
+        return timer.results(games)
+    finally:
+        bed.deactivate()
+
+
+def compare(results, baseline, threshold):
+    """
+    Return list of (name, size, baseline us, current us, ratio) for
+        results also in baseline, and True if any ratio is over threshold
+    """
+    before = dict(((result['name'], result['size']), result['us_per_call'])
+                  for result in baseline['results'])
+    rows = []
+    regressed = False
+    for result in results:
+        key = (result['name'], result['size'])
+        if key not in before or not before[key]:
+            continue
+        ratio = result['us_per_call'] / before[key]
+        rows.append(key + (before[key], result['us_per_call'],
+                           round(ratio, 3)))
+        regressed = regressed or ratio > threshold
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Straight Gin benchmarks')
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='App Engine SDK directory')
+    parser.add_argument('--hands', type=int, default=2000,
+                        help='hands per size for engine benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--turns', type=int, default=10,
+                        help='turns played per game in API flows')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--out', default='-',
+                        help='JSON output file (default: stdout)')
+    parser.add_argument('--baseline',
+                        help='JSON output of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowest allowed ratio to baseline')
+    args = parser.parse_args(argv)
+
+    setup_sdk(args.sdk)
+    results = engine_benchmarks(args.hands, args.repeat, args.seed)
+    if not args.skip_api:
+        results += api_benchmarks(args.games, args.turns, args.seed)
+    report = {'meta': {'time': time.time(),
+                       'python': sys.version.split()[0],
+                       'seed': args.seed,
+                       'hands': args.hands,
+                       'games': args.games,
+                       'turns': args.turns},
+              'results': results}
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            rows, regressed = compare(results, json.load(baseline),
+                                      args.threshold)
+        report['baseline'] = {'file': args.baseline,
+                              'threshold': args.threshold,
+                              'regressed': regressed,
+                              'compared': [dict(zip(('name', 'size',
+                                                     'baseline_us',
+                                                     'us', 'ratio'), row))
+                                           for row in rows]}
+        for row in rows:
+            flag = ' REGRESSED' if row[4] > args.threshold else ''
+            sys.stderr.write('%-24s %4s %12.3f -> %12.3f us  x%.3f%s\n'
+                             % (row + (flag,)))
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        json.dump(report, out, indent=2, sort_keys=True)
+        out.write('\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
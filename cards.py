@@ -0,0 +1,87 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# compact card encoding for Straight_Gin_API
+#
+# Each card is a small int: suit * 13 + rank, where suits follow the order
+# of constants.FULL_DECK (H, D, C, S) and rank runs 0 (Ace) to 12 (King).
+# A collection of cards (hand, deck, draw_card) is a 52-bit mask with bit
+# "card" set for every card present. String names ('H-10', 'D-K') are only
+# used at the API edge.
+
+import constants
+
+SUITS = 'HDCS'
+RANKS = 13
+DECK_SIZE = len(SUITS) * RANKS
+FULL_DECK_MASK = (1 << DECK_SIZE) - 1
+SUIT_MASK = (1 << RANKS) - 1
+
+# Human-readable names, indexed by card int
+CARD_NAMES = tuple(constants.FULL_DECK)
+CARD_INDEX = dict((name, card) for card, name in enumerate(CARD_NAMES))
+# Penalty points of each card (face card pts != 10, i.e. K = 13)
+CARD_VALUES = tuple(card % RANKS + 1 for card in xrange(DECK_SIZE))
+
+
+def card_to_str(card):
+    """ Return human-readable name of card int (i.e. 9 -> 'H-10') """
+    return CARD_NAMES[card]
+
+
+def str_to_card(name):
+    """
+    Return card int for human-readable card name
+    Raises ValueError if name is not a card
+    """
+    try:
+        return CARD_INDEX[name.strip().upper()]
+    except (KeyError, AttributeError):
+        raise ValueError('Not a card: %r' % (name,))
+
+
+def mask_to_cards(mask):
+    """ Return list of card ints in mask, lowest card first """
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(low.bit_length() - 1)
+        mask ^= low
+    return cards
+
+
+def cards_to_mask(cards):
+    """ Return mask of iterable of card ints """
+    mask = 0
+    for card in cards:
+        mask |= 1 << card
+    return mask
+
+
+def mask_to_strings(mask):
+    """ Return list of card names in mask, sorted by suit then rank """
+    return [CARD_NAMES[card] for card in mask_to_cards(mask)]
+
+
+def strings_to_mask(names):
+    """ Return mask of iterable of card names """
+    mask = 0
+    for name in names:
+        if name:
+            mask |= 1 << str_to_card(name)
+    return mask
+
+
+def mask_to_text(mask):
+    """ Return space-separated card names in mask (API edge format) """
+    return ' '.join(mask_to_strings(mask))
+
+
+def card_count(mask):
+    """ Return number of cards in mask """
+    return bin(mask).count('1')
+
+
+def suit_ranks(mask, suit):
+    """ Return 13-bit rank mask of cards of suit (index into SUITS) """
+    return (mask >> (suit * RANKS)) & SUIT_MASK
@@ -0,0 +1,59 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# computer opponent for Straight_Gin_API
+#
+# Decisions use only the computer's own hand and the visible draw_card.
+# Every candidate discard is scored in one melds.best_discard search; if
+# the search runs past the move's deadline, a quick rule of thumb is used
+# instead so the move still fits in the request.
+
+import time
+import cards
+import melds
+from rules import TAKE_VISIBLE, TAKE_HIDDEN
+
+
+def deadline_after(budget_ms):
+    """ Return time.time() deadline budget_ms milliseconds from now """
+    return time.time() + budget_ms / 1000.0
+
+
+def choose_draw(hand, draw_card, deadline=None):
+    """
+    Return TAKE_VISIBLE if taking draw_card (and then discarding
+        something else) lowers deadwood, otherwise TAKE_HIDDEN
+    hand, draw_card: card masks
+    """
+    if not draw_card:
+        return TAKE_HIDDEN
+    try:
+        card, penalty = melds.best_discard(hand | draw_card, deadline)
+    except melds.SearchTimeout:
+        return TAKE_HIDDEN
+    if 1 << card != draw_card and penalty < melds.deadwood(hand):
+        return TAKE_VISIBLE
+    return TAKE_HIDDEN
+
+
+def choose_discard(hand, deadline=None):
+    """
+    Return (card, out): card int to discard from hand, and whether to go
+        "OUT" (only when no deadwood remains after the discard)
+    """
+    try:
+        card, penalty = melds.best_discard(hand, deadline)
+    except melds.SearchTimeout:
+        return _quick_discard(hand), False
+    return card, penalty == 0
+
+
+def _quick_discard(hand):
+    """ Return highest-value card in hand not part of any meld in hand """
+    melded = 0
+    for meld in melds.MELDS:
+        if meld & hand == meld:
+            melded |= meld
+    candidates = cards.mask_to_cards(hand & ~melded) or \
+        cards.mask_to_cards(hand)
+    return max(candidates, key=lambda card: cards.CARD_VALUES[card])
@@ -14,6 +14,40 @@ FULL_DECK = ['H-A', 'H-2', 'H-3', 'H-4', 'H-5', 'H-6', 'H-7',
              'S-A', 'S-2', 'S-3', 'S-4', 'S-5', 'S-6', 'S-7',
              'S-8', 'S-9', 'S-10', 'S-J', 'S-Q', 'S-K']
 
-LIBRARY = {'A': '1', 'J': '11', 'Q': '12', 'K': '13'}
-
 HAND_SIZE = 10
+
+# Most deadwood penalties kept in utils.HAND_CACHE (per instance)
+HAND_CACHE_SIZE = 10000
+
+# Most shuffled decks kept in deck.ORDER_CACHE (per instance)
+DECK_CACHE_SIZE = 2000
+
+# Computer opponent: reserved user_name, and time allowed for each of its
+# turns (played inline in the end_move request)
+COMPUTER_NAME = 'Computer'
+COMPUTER_MOVE_BUDGET_MS = 5
+
+# Results per page of list endpoints (page_size parameter)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Move alerts: seconds over which a user's alerts (all games) are collected
+# into one digest e-mail
+MOVE_ALERT_WINDOW = 300
+
+# User win/loss counters: shards per user, and seconds a user's summed
+# counters stay in memcache
+STAT_SHARDS = 10
+STATS_CACHE_SECONDS = 60
+
+# Seconds memcache remembers that the UserName index is incomplete (while
+# migrate_user_names runs) before the datastore is checked again
+NAMES_INDEX_CHECK_SECONDS = 60
+
+# Entries kept on each leaderboard (models/leaderboard.py)
+LEADERBOARD_SIZE = 100
+
+# poll_game: longest wait for a Game to change, and seconds between checks
+# of its version in memcache
+POLL_TIMEOUT = 25
+POLL_INTERVAL = 0.5
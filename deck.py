@@ -0,0 +1,75 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# seedable deck for Straight_Gin_API
+
+import random
+import constants
+from cards import DECK_SIZE
+from lru import LRUCache
+
+# Seeds are stored in ndb.IntegerProperty (signed 64-bit)
+SEED_BITS = 62
+
+# Dealing orders of recently dealt seeds. A Game draws one card per
+# request and only stores its seed, so without it every draw would
+# shuffle the whole deck again
+ORDER_CACHE = LRUCache(constants.DECK_CACHE_SIZE)
+
+
+def shuffled_order(seed):
+    """
+    Return tuple of all card ints in Fisher-Yates shuffled order for seed
+    Uses only Random.random(), whose output for a given seed is stable
+        across Python versions, so a seed always gives the same deck
+    """
+    rng = random.Random(seed)
+    order = range(DECK_SIZE)
+    for i in xrange(DECK_SIZE - 1, 0, -1):
+        j = int(rng.random() * (i + 1))
+        order[i], order[j] = order[j], order[i]
+    return tuple(order)
+
+
+class Deck(object):
+    """
+    Deck of cards, shuffled once and dealt from a cursor
+    State is saved as (seed, offset); the order of a seed is shuffled once
+        per instance while it stays in ORDER_CACHE
+
+    Attributes:
+        seed: seed the deck was shuffled with
+        offset: number of cards dealt so far
+        order: card ints in dealing order (shared, never changed)
+    """
+    def __init__(self, seed=None, offset=0):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(SEED_BITS)
+        self.seed = seed
+        self.offset = offset
+        self.order = ORDER_CACHE.get(seed, shuffled_order)
+
+    def deal(self, count):
+        """
+        Return mask of next "count" cards and advance cursor
+        If fewer than "count" cards remain, return None and deal nothing
+        """
+        if count > self.remaining():
+            return None
+        hand = 0
+        for card in self.order[self.offset:self.offset + count]:
+            hand |= 1 << card
+        self.offset += count
+        return hand
+
+    def remaining(self):
+        """ Return number of cards left to deal """
+        return DECK_SIZE - self.offset
+
+    def remaining_mask(self):
+        """ Return mask of cards left to deal """
+        mask = 0
+        for card in self.order[self.offset:]:
+            mask |= 1 << card
+        return mask
+
@@ -2,82 +2,237 @@
 """ main.py - Contains handlers called by taskqueue and/or cronjobs. """
 
 import logging
+import cards
 import webapp2
-from google.appengine.api import mail, app_identity
+from datetime import date, datetime
+from google.appengine.api import mail, app_identity, taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
+from alerts import alert_window
 from api import StraightGinAPI
-from utils import get_by_urlsafe
 
-from models import User, Game
+from models import Game, PendingAlert, ReminderRun, ReminderBucket
+
+# Games scanned per reminder task (each player touched is one write)
+SCAN_BATCH_SIZE = 200
+# Reminder e-mails sent per task
+MAIL_BATCH_SIZE = 50
 
 
 class game_reminder_email(webapp2.RequestHandler):
     def get(self):
         """
-        Send a reminder email to each User with email address with games
-        in progress. Email body includes a count of in-progress games and
-        their urlsafe keys
+        Start today's reminder run: one pass over in-progress games,
+        grouped by player, then one e-mail per player with an email
+        address, listing count and urlsafe keys of their games.
+        Work is split into batches on the taskqueue (see scan_reminders,
+        send_reminders); a second call on the same day does nothing
         Called every day using a cron job
         """
-        app_id = app_identity.get_application_id()
-        users = User.query(User.email != None)
-
-        for user in users:
-            q = user.all_games()
-            games = q.filter(Game.game_over == False)
-            if games.count() > 0:
-                subject = 'In Progress game reminder!'
-                body = 'Hello {}, you have {} games in progress.' \
-                       ' Their keys are: {}'.\
-                       format(user.name,
-                              games.count(),
-                              ', '.join(game.key.urlsafe() for game in games))
-                logging.debug(body)
-                # Send emails
-                # Arguments to send_mail are: from, to, subject, body
-                mail.send_mail('noreply@{}.appspotmail.com'.
-                               format(app_identity.get_application_id()),
-                               user.email,
-                               subject,
-                               body)
+        @ndb.transactional
+        def start():
+            run_key = ndb.Key(ReminderRun, date.today().isoformat())
+            if run_key.get():
+                return None
+            ReminderRun(key=run_key).put()
+            taskqueue.add(url='/tasks/reminders/scan',
+                          params={'run': run_key.id(), 'batch': 0},
+                          transactional=True)
+            return run_key
+        run_key = start()
+        if run_key:
+            logging.info('Reminder run %s started', run_key.id())
+        else:
+            logging.info('Reminder run already started today')
+
+
+def reminder_batch(handler):
+    """
+    Return (run, batch) of reminder task, or (None, batch) if the batch
+    was already committed (task retried after it succeeded)
+    Tasks call it before doing any work, so a retry of a committed batch
+    stops there (it would otherwise scan or e-mail the next batch), and
+    again inside the batch's transaction, which commits only if it holds
+    """
+    batch = int(handler.request.get('batch'))
+    run = ndb.Key(ReminderRun, handler.request.get('run')).get()
+    if run is None or run.batches != batch:
+        return None, batch
+    return run, batch
+
+
+class scan_reminders(webapp2.RequestHandler):
+    def post(self):
+        """
+        Add one batch of in-progress Games to their players'
+        ReminderBuckets, then queue the next batch (or the first send).
+        Buckets, run progress and next task are committed in one
+        transaction, so a failed batch is retried from its cursor
+        without counting any game twice
+        Uses appEngine Push Queue
+        """
+        run, batch = reminder_batch(self)
+        if run is None:
+            logging.info('Reminder batch %d already scanned', batch)
+            return
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = Cursor(urlsafe=self.request.get('cursor'))
+        games, next_cursor, more = Game.query(
+            Game.game_over == False).fetch_page(
+                SCAN_BATCH_SIZE, start_cursor=cursor,
+                projection=[Game.player_one, Game.player_two])
+
+        # group games by player
+        players = {}
+        for game in games:
+            for player in (game.player_one, game.player_two):
+                players.setdefault(player, []).append(game.key.urlsafe())
+
+        @ndb.transactional
+        def commit():
+            run, batch = reminder_batch(self)
+            if run is None:
+                return None
+            keys = [ReminderBucket.key_for(run.key, player)
+                    for player in players]
+            buckets = ndb.get_multi(keys)
+            for i, player in enumerate(players):
+                if buckets[i] is None:
+                    buckets[i] = ReminderBucket(key=keys[i], user=player)
+                buckets[i].games.extend(players[player])
+            run.batches += 1
+            run.games += len(games)
+            if more and next_cursor:
+                taskqueue.add(url='/tasks/reminders/scan',
+                              params={'run': run.key.id(),
+                                      'batch': run.batches,
+                                      'cursor': next_cursor.urlsafe()},
+                              transactional=True)
+            else:
+                run.state = 'sending'
+                taskqueue.add(url='/tasks/reminders/send',
+                              params={'run': run.key.id(),
+                                      'batch': run.batches},
+                              transactional=True)
+            ndb.put_multi(buckets + [run])
+            return run
+        run = commit()
+        if run:
+            logging.info('Reminder run %s: scanned %d games (%s)',
+                         run.key.id(), run.games, run.state)
+
+
+class send_reminders(webapp2.RequestHandler):
+    def post(self):
+        """
+        Send reminder e-mails for one batch of ReminderBuckets, then
+        delete them and queue the next batch (in one transaction, with
+        run progress). If a batch fails, its buckets are still there and
+        the retry sends them (a player may get the reminder twice)
+        Uses appEngine Push Queue
+        """
+        run, batch = reminder_batch(self)
+        if run is None:
+            logging.info('Reminder batch %d already sent', batch)
+            return
+        run_key = run.key
+        # ancestor query: strongly consistent, sees earlier deletes
+        buckets = ReminderBucket.query(ancestor=run_key).fetch(
+            MAIL_BATCH_SIZE)
+        users = ndb.get_multi([bucket.user for bucket in buckets])
+        sender = 'noreply@{}.appspotmail.com'.format(
+            app_identity.get_application_id())
+        sent = 0
+        for bucket, user in zip(buckets, users):
+            if not user or not user.email:
+                continue
+            subject = 'In Progress game reminder!'
+            body = 'Hello {}, you have {} games in progress.' \
+                   ' Their keys are: {}'.\
+                   format(user.name,
+                          len(bucket.games),
+                          ', '.join(bucket.games))
+            logging.debug(body)
+            # Arguments to send_mail are: from, to, subject, body
+            mail.send_mail(sender, user.email, subject, body)
+            sent += 1
+
+        @ndb.transactional
+        def commit():
+            run, batch = reminder_batch(self)
+            if run is None:
+                return None
+            run.batches += 1
+            run.sent += sent
+            if len(buckets) == MAIL_BATCH_SIZE:
+                taskqueue.add(url='/tasks/reminders/send',
+                              params={'run': run.key.id(),
+                                      'batch': run.batches},
+                              transactional=True)
+            else:
+                run.state = 'done'
+                run.finished = datetime.now()
+            ndb.delete_multi([bucket.key for bucket in buckets])
+            run.put()
+            return run
+        run = commit()
+        if run:
+            logging.info('Reminder run %s: sent %d e-mails (%s)',
+                         run.key.id(), run.sent, run.state)
 
 
 class move_alert_email(webapp2.RequestHandler):
     def post(self):
         """
-        Send a reminder email to player (if email address on file) each time
-        the opponent in a game completes a move. Email body provides
-        urlsafe key, player's hand, visible draw_card and instructions.
+        Send one digest e-mail to player (if email address on file) for
+        every game where the opponent moved during the alert window (see
+        alerts.py) and it is still the player's turn. For each game, the
+        e-mail provides urlsafe key, player's hand, visible draw_card and
+        instructions. The games' PendingAlerts are then deleted
         Uses appEngine Push Queue
         """
-        app_id = app_identity.get_application_id()
-        user = get_by_urlsafe(self.request.get('user_key'), User)
-        game = get_by_urlsafe(self.request.get('game_key'), Game)
+        user_key = ndb.Key(urlsafe=self.request.get('user_key'))
+        # window is missing from tasks queued before it was a parameter
+        window = self.request.get('window')
+        alerts = PendingAlert.due(user_key, int(window) if window else
+                                  alert_window())
+        if not alerts:
+            return
+        # a game still pending from an earlier window is sent once
+        user, games = user_key.get(), ndb.get_multi(
+            sorted(set(alert.key.parent() for alert in alerts)))
 
-        # Get hand of current player
-        if game.active_player == game.player_one:
-            hand = game.hand_one
-        else:
-            hand = game.hand_two
-
-        # Format game data for e-mail
-        sorted_hand = sorted(hand)
-        string_hand = ' '.join(str(card) for card in sorted_hand)
-        string_card = ' '.join(game.draw_card)
-
-        # Prepare e-mail
-        subject = 'Your turn!'
-        body = "Hello {}: Your opponent just moved, so it's your turn." \
-               " Your hand is {}. The visible card is {}." \
-               " When you go to start_move, enter 1 to take visible card" \
-               " or 2 to draw from pile. The game key is {}.". \
-               format(user.name, string_hand, string_card, game.key.urlsafe())
-        logging.debug(body)
-        # Arguments to send_mail are: from, to, subject, body
-        mail.send_mail('noreply@{}.appspotmail.com'.format(
-            app_identity.get_application_id()), user.email, subject, body)
+        # skip games that ended (or were cancelled) or where player
+        # already moved
+        lines = []
+        for game in games:
+            if game is None or game.game_over or \
+                    game.active_player != user_key:
+                continue
+            # Format game data for e-mail
+            lines.append('Game {}: your hand is {}. The visible card is {}.'
+                         .format(game.key.urlsafe(),
+                                 cards.mask_to_text(game.active_hand()),
+                                 cards.mask_to_text(game.draw_card)))
+
+        if lines and user and user.email:
+            # Prepare e-mail
+            subject = 'Your turn!'
+            body = "Hello {}: Your opponent just moved, so it's your turn" \
+                   " in {} game(s). {} When you go to start_move, enter 1" \
+                   " to take visible card or 2 to draw from pile.". \
+                   format(user.name, len(lines), ' '.join(lines))
+            logging.debug(body)
+            # Arguments to send_mail are: from, to, subject, body
+            mail.send_mail('noreply@{}.appspotmail.com'.format(
+                app_identity.get_application_id()), user.email, subject,
+                body)
+        ndb.delete_multi([alert.key for alert in alerts])
 
 app = webapp2.WSGIApplication([
     ('/crons/reminders', game_reminder_email),
-    ('/tasks/send_moves', move_alert_email),
+    ('/tasks/reminders/scan', scan_reminders),
+    ('/tasks/reminders/send', send_reminders),
+    ('/tasks/send_move_email', move_alert_email),
 ], debug=True)
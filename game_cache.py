@@ -0,0 +1,124 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# memcache write-through cache for Game entities in Straight_Gin_API
+#
+# Clients poll get_game far more often than games change, so Games are
+# kept in memcache and rewritten there every time they are saved
+# (Game._post_put_hook). Each Game carries a version, bumped on every put,
+# and memcache holds two entries per Game:
+#   'game:<urlsafe key>'          the entity
+#   'game-version:<urlsafe key>'  the latest saved version
+# A cached entity is only served if its version matches the latest one,
+# so an entry left behind by a lost or racing write is never used. Moves
+# save Games in transactions, so versions strictly increase, and store()
+# only ever raises the cached version (compare-and-set), so two writes
+# stored in the wrong order can't bring back the older one. Reads that
+# miss go to the datastore and refill memcache with add(), which never
+# overwrites what a concurrent write just stored. Each lookup is counted
+# as a hit, miss or stale in the endpoint_stats line of the request
+# (see instrumentation.count_cache).
+
+import logging
+from google.appengine.api import memcache
+
+import instrumentation
+from utils import key_from_urlsafe
+
+# compare-and-set attempts before store() gives up and evicts
+CAS_RETRIES = 5
+
+
+def entity_key(urlsafe):
+    return 'game:' + urlsafe
+
+
+def version_key(urlsafe):
+    return 'game-version:' + urlsafe
+
+
+def get(urlsafe, model):
+    """
+    Return entity the urlsafe key points to, from memcache if the cached
+        copy is current, otherwise from the datastore (see get_by_urlsafe)
+    Returns None if no entity exists
+    Raises BadRequestException if key is malformed, ValueError if the
+        entity is of the incorrect kind
+    """
+    key = key_from_urlsafe(urlsafe)
+    urlsafe = key.urlsafe()
+    cached = memcache.get_multi([entity_key(urlsafe), version_key(urlsafe)])
+    entity = cached.get(entity_key(urlsafe))
+    version = cached.get(version_key(urlsafe))
+    if entity is not None and version is not None and \
+            entity.version == version:
+        _count('hits')
+        return _check_kind(entity, model)
+    _count('stale' if entity is not None else 'misses')
+
+    entity = key.get()
+    if entity is None:
+        return None
+    _check_kind(entity, model)
+    if version is not None and version == entity.version:
+        # cached copy is behind the cached version (see store): replace it
+        memcache.set(entity_key(urlsafe), entity)
+    else:
+        memcache.add_multi({entity_key(urlsafe): entity,
+                            version_key(urlsafe): entity.version})
+    return entity
+
+
+def store(entity):
+    """
+    Write saved entity (and its version) through to memcache, unless a
+        later version is already cached
+    """
+    urlsafe = entity.key.urlsafe()
+    client = memcache.Client()
+    if entity.version == 1:
+        # first save: nothing is cached yet, so both are added in one call
+        # (whatever was already there goes through compare-and-set below)
+        if not client.add_multi({entity_key(urlsafe): entity,
+                                 version_key(urlsafe): entity.version}):
+            return
+    for _ in xrange(CAS_RETRIES):
+        cached = client.gets(version_key(urlsafe))
+        if cached is not None and cached >= entity.version:
+            return
+        if cached is None:
+            raised = client.add(version_key(urlsafe), entity.version)
+        else:
+            raised = client.cas(version_key(urlsafe), entity.version)
+        if raised:
+            break
+    else:
+        evict(entity.key)
+        return
+    # an older write landing here later only leaves an entity whose
+    # version doesn't match, which get() never serves
+    if not client.set(entity_key(urlsafe), entity):
+        # drop whatever is left, so no stale copy can match
+        evict(entity.key)
+
+
+def evict(key):
+    """ Remove entity from memcache (i.e. when deleted) """
+    urlsafe = key.urlsafe()
+    if not memcache.delete_multi([entity_key(urlsafe), version_key(urlsafe)]):
+        logging.warning('game_cache: could not evict %s', urlsafe)
+
+
+def cached_version(urlsafe):
+    """ Return latest saved version in memcache, or None if evicted """
+    return memcache.get(version_key(urlsafe))
+
+
+def _count(outcome):
+    instrumentation.count_cache('game_cache', outcome)
+
+
+def _check_kind(entity, model):
+    if not isinstance(entity, model):
+        raise ValueError('Incorrect Kind')
+    return entity
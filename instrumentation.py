@@ -0,0 +1,294 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# per-endpoint latency and RPC instrumentation for Straight_Gin_API
+#
+# Every StraightGinAPI method is wrapped with @instrumented, which logs
+# one structured (JSON) line per call:
+#   {"endpoint": ..., "wall_ms": ..., "cpu_ms": ...,
+#    "datastore": {"Get": 1, "Put": 1, ...}, "memcache": {...},
+#    "rpcs": ..., "round_trips": ...,
+#    "bytes_read": ..., "bytes_written": ...,
+#    "caches": {"game_cache": {"hits": 1}, "hand_cache": {...}}}
+# RPCs are counted by apiproxy pre/post-call hooks, so calls made by ndb,
+# memcache and taskqueue are all seen. bytes_read/bytes_written are the
+# encoded sizes of datastore entities read and written. RPCs that failed
+# are also counted under "errors" (a failed datastore_v3.Commit is a
+# transaction that lost to a concurrent write and was retried).
+# "caches" counts lookups of in-process and memcache caches by outcome,
+# reported by the caches themselves (count_cache), and is left out when
+# the call used none.
+# "round_trips" counts serial round-trips: RPCs started while another is
+# still in flight (i.e. overlapped by ndb tasklets) share one. cpu_ms is
+# the request's CPU where the runtime reports it; python27 doesn't, so
+# the line has process_cpu_ms instead: CPU of the whole process, which
+# with threadsafe: yes includes every request running at the same time.
+#
+# A sampling profiler can be turned on per request (header
+# X-Gin-Profile: 1) or for every request (PROFILE_ALL); the most frequent
+# stacks are added to the log line.
+#
+# Tests can hold endpoints to a budget (see test_rpc_budgets.py):
+#   with rpc_budget(datastore=3, memcache=2, round_trips=4):
+#       api.get_game(request)
+
+import collections
+import contextlib
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import quota
+
+PROFILE_HEADER = 'X-Gin-Profile'
+# profile every request (i.e. on a dev server)
+PROFILE_ALL = False
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP = 10
+
+_local = threading.local()
+
+
+class RpcStats(object):
+    """ RPCs (by service and call) and entity bytes seen while active """
+    def __init__(self):
+        self.calls = collections.defaultdict(collections.Counter)
+        self.errors = collections.Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.round_trips = 0
+        self.in_flight = 0
+        self.caches = collections.defaultdict(collections.Counter)
+
+    def count(self, service):
+        """ Return number of RPCs to service """
+        return sum(self.calls[service].itervalues())
+
+    def total(self):
+        """ Return number of RPCs to all services """
+        return sum(self.count(service) for service in self.calls)
+
+    def to_dict(self):
+        stats = dict((service, dict(calls))
+                     for service, calls in self.calls.iteritems())
+        stats.update(rpcs=self.total(),
+                     round_trips=self.round_trips,
+                     bytes_read=self.bytes_read,
+                     bytes_written=self.bytes_written)
+        if self.errors:
+            stats['errors'] = dict(self.errors)
+        if self.caches:
+            stats['caches'] = dict((cache, dict(outcomes))
+                                   for cache, outcomes
+                                   in self.caches.iteritems())
+        return stats
+
+
+class BudgetExceeded(AssertionError):
+    """ Raised by rpc_budget when more RPCs were made than allowed """
+
+
+def _active():
+    """ Return list of RpcStats collecting RPCs of this thread """
+    if not hasattr(_local, 'active'):
+        _local.active = []
+    return _local.active
+
+
+def _entity_bytes(service, call, request, response):
+    """ Return (bytes read, bytes written) of datastore entities in RPC """
+    if service != 'datastore_v3':
+        return 0, 0
+    if call == 'Get':
+        return sum(result.entity().ByteSize()
+                   for result in response.entity_list()
+                   if result.has_entity()), 0
+    if call in ('RunQuery', 'Next'):
+        return sum(result.ByteSize() for result in response.result_list()), 0
+    if call == 'Put':
+        return 0, sum(entity.ByteSize() for entity in request.entity_list())
+    return 0, 0
+
+
+def _pre_call_hook(service, call, request, response, rpc=None):
+    """ apiproxy hook: count a round-trip if no other RPC is in flight """
+    for stats in _active():
+        if not stats.in_flight:
+            stats.round_trips += 1
+        stats.in_flight += 1
+
+
+def _post_call_hook(service, call, request, response, rpc=None, error=None):
+    """ apiproxy hook: count finished RPC in every active RpcStats """
+    active = _active()
+    if not active:
+        return
+    read = written = 0
+    if error is None:
+        try:
+            read, written = _entity_bytes(service, call, request, response)
+        except Exception:
+            pass
+    for stats in active:
+        stats.in_flight = max(0, stats.in_flight - 1)
+        stats.calls[service][call] += 1
+        stats.bytes_read += read
+        stats.bytes_written += written
+        if error is not None:
+            stats.errors['%s.%s' % (service, call)] += 1
+
+
+def count_cache(cache, outcome):
+    """ Count a lookup of cache (i.e. 'hits') in every active RpcStats """
+    for stats in _active():
+        stats.caches[cache][outcome] += 1
+
+
+def lookup_counter(cache):
+    """ Return on_lookup callback of an LRUCache, counted as cache """
+    def on_lookup(hit):
+        count_cache(cache, 'hits' if hit else 'misses')
+    return on_lookup
+
+
+def install():
+    """
+    Install the RPC hooks on the current apiproxy (does nothing if
+        already installed; testbed replaces the apiproxy, so collect()
+        calls this every time)
+    """
+    apiproxy = apiproxy_stub_map.apiproxy
+    apiproxy.GetPreCallHooks().Append('gin_instrumentation', _pre_call_hook)
+    apiproxy.GetPostCallHooks().Append('gin_instrumentation',
+                                       _post_call_hook)
+
+
+@contextlib.contextmanager
+def collect():
+    """ Yield RpcStats of RPCs made by this thread within the block """
+    install()
+    stats = RpcStats()
+    _active().append(stats)
+    try:
+        yield stats
+    finally:
+        _active().remove(stats)
+
+
+@contextlib.contextmanager
+def rpc_budget(datastore=None, memcache=None, total=None,
+               round_trips=None):
+    """
+    Yield RpcStats of the block; raise BudgetExceeded if it made more
+        datastore, memcache or total RPCs, or serial round-trips, than
+        given (None: no limit)
+    """
+    with collect() as stats:
+        yield stats
+    over = []
+    for name, limit, used in (('datastore', datastore,
+                               stats.count('datastore_v3')),
+                              ('memcache', memcache,
+                               stats.count('memcache')),
+                              ('total', total, stats.total()),
+                              ('round_trips', round_trips,
+                               stats.round_trips)):
+        if limit is not None and used > limit:
+            over.append('%s %d > %d' % (name, used, limit))
+    if over:
+        raise BudgetExceeded('RPC budget exceeded (%s): %s'
+                             % (', '.join(over), stats.to_dict()))
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stack of one thread every PROFILE_INTERVAL seconds from
+        a background thread; top() returns the most frequent stacks
+    """
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = tuple('%s:%d %s' % (filename, line, name)
+                          for filename, line, name, _
+                          in traceback.extract_stack(frame))
+            self.samples[stack] += 1
+
+    def top(self, count=PROFILE_TOP):
+        """ Return [{stack, samples}] of the most frequent stacks """
+        return [{'stack': list(stack), 'samples': samples}
+                for stack, samples in self.samples.most_common(count)]
+
+
+def _cpu_clock():
+    """
+    Return (field, clock): clock() is CPU seconds used so far, logged as
+        field. Only the runtime knows a request's own CPU
+        (quota.get_request_cpu_usage, missing on python27); otherwise
+        the process's CPU is logged, as process_cpu_ms
+    """
+    if hasattr(quota, 'get_request_cpu_usage'):
+        return 'cpu_ms', lambda: quota.megacycles_to_cpu_seconds(
+            quota.get_request_cpu_usage())
+    return 'process_cpu_ms', time.clock
+
+
+def _profile_requested(service):
+    """ Return True if request asked for the profiler (see module doc) """
+    if PROFILE_ALL:
+        return True
+    state = getattr(service, 'request_state', None)
+    headers = getattr(state, 'headers', None)
+    return bool(headers and headers.get(PROFILE_HEADER) == '1')
+
+
+def instrumented(method):
+    """
+    Decorator for StraightGinAPI methods (under @endpoints.method): logs
+        wall/CPU time and RPC stats of each call as one JSON line
+    """
+    @functools.wraps(method)
+    def wrapper(self, request):
+        profiler = None
+        if _profile_requested(self):
+            profiler = SamplingProfiler(threading.current_thread().ident)
+            profiler.start()
+        record = {'endpoint': method.__name__}
+        cpu_field, cpu_clock = _cpu_clock()
+        cpu_started = cpu_clock()
+        started = time.time()
+        try:
+            with collect() as stats:
+                return method(self, request)
+        except Exception as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['wall_ms'] = round((time.time() - started) * 1e3, 3)
+            record[cpu_field] = round((cpu_clock() - cpu_started) * 1e3, 3)
+            record.update(stats.to_dict())
+            if profiler:
+                profiler.stop()
+                record['profile'] = profiler.top()
+            logging.info('endpoint_stats %s', json.dumps(record,
+                                                         sort_keys=True))
+    return wrapper
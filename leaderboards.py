@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+""" leaderboards.py - Task handler that adds Scores to the leaderboards. """
+
+import logging
+import webapp2
+from google.appengine.ext import ndb
+
+from models import Leaderboard
+from models.leaderboard import SCORE_WINDOWS, score_board_name, score_entry
+from utils import get_user_names
+
+
+class update_score_boards(webapp2.RequestHandler):
+    def post(self):
+        """
+        Add a new Score to the all-time, day and week high score boards
+        (day and week of the Score's date), in one transaction; adding
+        the same Score again changes nothing, so retries are safe
+        Called by Game.score_game; uses appEngine Push Queue
+        """
+        score = ndb.Key(urlsafe=self.request.get('score')).get()
+        if score is None:
+            return
+        # all-time board is built from existing Scores the first time
+        Leaderboard.get_board(score_board_name('all'))
+        names = get_user_names([score.winner, score.loser])
+        Leaderboard.update([score_board_name(window, score.date)
+                            for window in SCORE_WINDOWS],
+                           [score_entry(score, names)])
+        logging.debug('Score %s added to leaderboards', score.key.urlsafe())
+
+app = webapp2.WSGIApplication([
+    ('/tasks/leaderboards', update_score_boards),
+], debug=True)
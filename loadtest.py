@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# local load generator for Straight_Gin_API
+#
+# Worker threads create games and play them to the end through the real
+# StraightGinAPI methods, against App Engine testbed stubs (see
+# testing.py): each turn polls get_game a few times, reads the active
+# player's hand and plays a whole turn with make_move, with random think
+# time between calls. Every game seats one of a few "popular" users, so
+# their User rows are written by many games at once.
+#
+# The report (JSON) gives throughput and p50/p95/p99 latency per
+# endpoint, errors, and contention: failed datastore commits (each one a
+# transaction retried by ndb after losing to a concurrent write, counted
+# by instrumentation.py) and transactions that gave up.
+#
+# Example:
+#   python loadtest.py --sdk ~/google_appengine --games 2000 --workers 32
+
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from testing import setup_sdk, start_testbed
+
+
+def percentile(samples, fraction):
+    """ Return nearest-rank percentile of sorted samples """
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(fraction * len(samples)))
+    return samples[index]
+
+
+class LoadStats(object):
+    """ Latencies, errors and RPC stats of every call, from all workers """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.defaultdict(collections.Counter)
+        self.datastore_rpcs = collections.Counter()
+        self.rpc_errors = collections.Counter()
+        self.games_started = 0
+        self.games_finished = 0
+
+    def record(self, name, seconds, error, rpcs):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if error:
+                self.errors[name][error] += 1
+            self.datastore_rpcs[name] += rpcs.count('datastore_v3')
+            self.rpc_errors.update(rpcs.errors)
+
+    def report(self, elapsed):
+        """ Return report dict (elapsed: seconds the load ran) """
+        endpoints = {}
+        calls = 0
+        for name, samples in sorted(self.latencies.iteritems()):
+            samples = sorted(samples)
+            calls += len(samples)
+            endpoints[name] = {
+                'calls': len(samples),
+                'calls_per_s': round(len(samples) / elapsed, 1),
+                'errors': dict(self.errors[name]),
+                'datastore_rpcs_per_call': round(
+                    float(self.datastore_rpcs[name]) / len(samples), 2),
+                'p50_ms': round(percentile(samples, 0.50) * 1e3, 3),
+                'p95_ms': round(percentile(samples, 0.95) * 1e3, 3),
+                'p99_ms': round(percentile(samples, 0.99) * 1e3, 3),
+                'max_ms': round(samples[-1] * 1e3, 3)}
+        gave_up = sum(errors['TransactionFailedError']
+                      for errors in self.errors.itervalues())
+        return {'elapsed_s': round(elapsed, 3),
+                'calls': calls,
+                'calls_per_s': round(calls / elapsed, 1),
+                'games_started': self.games_started,
+                'games_finished': self.games_finished,
+                'endpoints': endpoints,
+                'contention': {
+                    'commit_retries': self.rpc_errors['datastore_v3.Commit'],
+                    'transactions_failed': gave_up,
+                    'rpc_errors': dict(self.rpc_errors)}}
+
+
+class Worker(threading.Thread):
+    """ Plays games one after another until the shared game count is used """
+    def __init__(self, load, index):
+        super(Worker, self).__init__(name='load-%d' % index)
+        self.daemon = True
+        self.load = load
+        self.rng = random.Random((load.args.seed << 32) + index)
+
+    def call(self, name, method, request):
+        """ Return method(request), or None if it raised (recorded) """
+        import instrumentation
+        from google.appengine.ext import ndb
+        # each call starts like a new request
+        ndb.get_context().clear_cache()
+        error = None
+        started = time.time()
+        with instrumentation.collect() as rpcs:
+            try:
+                return method(request)
+            except Exception as e:
+                error = type(e).__name__
+                return None
+            finally:
+                self.load.stats.record(name, time.time() - started, error,
+                                       rpcs)
+
+    def think(self):
+        """ Wait a random think time (exponential, mean --think-ms) """
+        if self.load.args.think_ms > 0:
+            time.sleep(self.rng.expovariate(1e3 / self.load.args.think_ms))
+
+    def run(self):
+        while self.load.take_game():
+            self.play_game()
+
+    def play_game(self):
+        import cards
+        import computer
+        from api import NEW_GAME_REQUEST, GET_GAME_VERSION_REQUEST, \
+            GET_HAND_REQUEST, MAKE_MOVE_REQUEST
+        from rules import TAKE_HIDDEN
+
+        api, args, stats = self.load.api, self.load.args, self.load.stats
+        player_one = self.rng.choice(self.load.popular)
+        player_two = self.rng.choice([name for name in self.load.users
+                                      if name != player_one])
+        game = self.call('new_game', api.new_game,
+                         NEW_GAME_REQUEST.combined_message_class(
+                             player_one=player_one, player_two=player_two))
+        if game is None:
+            return
+        with stats.lock:
+            stats.games_started += 1
+        key = game.urlsafe_key
+
+        for _ in xrange(args.max_turns):
+            # opponent's client polls until it's its turn (with the
+            # version it has, so unchanged polls are not_modified)
+            for _ in xrange(args.polls):
+                self.think()
+                polled = self.call('get_game', api.get_game,
+                                   GET_GAME_VERSION_REQUEST.
+                                   combined_message_class(
+                                       urlsafe_game_key=key,
+                                       version=game.version))
+                if polled and not polled.not_modified:
+                    game = polled
+            hand = self.call('get_hand', api.get_hand,
+                             GET_HAND_REQUEST.combined_message_class(
+                                 urlsafe_game_key=key,
+                                 user_name=game.active_player))
+            if hand is None:
+                return
+            card, _ = computer.choose_discard(
+                cards.strings_to_mask(hand.hand.split()))
+            self.think()
+            turn = self.call('make_move', api.make_move,
+                             MAKE_MOVE_REQUEST.combined_message_class(
+                                 urlsafe_game_key=key,
+                                 user_name=game.active_player,
+                                 draw=TAKE_HIDDEN,
+                                 discard=cards.card_to_str(card),
+                                 out=False))
+            if turn is None:
+                continue
+            game = turn.game
+            if game.game_over:
+                with stats.lock:
+                    stats.games_finished += 1
+                return
+
+
+class LoadTest(object):
+    """ Shared state of a load test run """
+    def __init__(self, args):
+        from api import StraightGinAPI
+        self.args = args
+        self.api = StraightGinAPI()
+        self.stats = LoadStats()
+        self.users = ['load-user-%d' % i for i in xrange(args.users)]
+        self.popular = self.users[:args.popular]
+        self._games_left = args.games
+        self._lock = threading.Lock()
+
+    def take_game(self):
+        """ Return True if another game should be played """
+        with self._lock:
+            if self._games_left <= 0:
+                return False
+            self._games_left -= 1
+            return True
+
+    def create_users(self):
+        from api import USER_REQUEST
+        for name in self.users:
+            self.api.create_user(USER_REQUEST.combined_message_class(
+                user_name=name))
+
+    def run(self):
+        """ Return report of playing all games across the workers """
+        self.create_users()
+        workers = [Worker(self, i) for i in xrange(self.args.workers)]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        report = self.stats.report(time.time() - started)
+        report['meta'] = dict(vars(self.args))
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Straight Gin load test')
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='App Engine SDK directory')
+    parser.add_argument('--games', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--popular', type=int, default=3,
+                        help='users seated in every game')
+    parser.add_argument('--polls', type=int, default=3,
+                        help='get_game calls before each turn')
+    parser.add_argument('--think-ms', type=float, default=20,
+                        help='mean think time between calls')
+    parser.add_argument('--max-turns', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='-',
+                        help='JSON output file (default: stdout)')
+    args = parser.parse_args(argv)
+    if args.popular >= args.users:
+        parser.error('--popular must be less than --users')
+
+    setup_sdk(args.sdk)
+    import logging
+    # endpoint_stats lines of every call would drown the report
+    logging.getLogger().setLevel(logging.WARNING)
+    bed = start_testbed()
+    try:
+        report = LoadTest(args).run()
+    finally:
+        bed.deactivate()
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        json.dump(report, out, indent=2, sort_keys=True)
+        out.write('\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# bounded LRU cache for Straight_Gin_API
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Memoize results of a function of one hashable argument, keeping at most
+    max_size results and evicting the least recently used first.
+    Safe to share between request threads (app.yaml threadsafe: yes).
+
+    Attributes:
+        max_size: most results kept
+        on_lookup: optional callable, called with True (hit) or False
+            (miss) after every lookup, i.e. to count them per request
+    """
+    def __init__(self, max_size, on_lookup=None):
+        self.max_size = max_size
+        self.on_lookup = on_lookup
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """ Return cached result for key, or compute(key) and cache it """
+        with self._lock:
+            try:
+                # re-insert to mark as most recently used
+                value = self._items.pop(key)
+                self._items[key] = value
+                hit = True
+            except KeyError:
+                hit = False
+        if self.on_lookup:
+            self.on_lookup(hit)
+        if hit:
+            return value
+        # compute outside the lock so slow keys don't block other threads
+        value = compute(key)
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        """ Drop all results """
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,127 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# meld table and exact deadwood solver for Straight_Gin_API
+#
+# Every possible meld (runs of 3+ consecutive cards in one suit, Aces low,
+# and sets of 3 or 4 cards of the same number) is precomputed as a card
+# mask. The solver always settles the lowest card left in the hand: either
+# it is deadwood, or it belongs to one of the melds starting with it. The
+# best penalty for each remaining-cards mask is memoized, so no hand is
+# solved twice within a search.
+#
+# best_discard extends the same search with one "free" card to throw
+# away, so every candidate discard of a hand is scored in a single search
+# that shares its memo, instead of solving the hand once per discard.
+
+import time
+from cards import SUITS, RANKS, DECK_SIZE, CARD_VALUES
+
+
+class SearchTimeout(Exception):
+    """ Raised when best_discard runs past its deadline """
+
+
+def _build_melds():
+    """ Return list of every meld as a card mask """
+    melds = []
+    # runs: 3 to 13 consecutive ranks within one suit
+    for suit in xrange(len(SUITS)):
+        for start in xrange(RANKS):
+            for end in xrange(start + 3, RANKS + 1):
+                run = ((1 << (end - start)) - 1) << start
+                melds.append(run << (suit * RANKS))
+    # sets: 3 or 4 cards of the same rank
+    for rank in xrange(RANKS):
+        same_rank = [1 << (suit * RANKS + rank)
+                     for suit in xrange(len(SUITS))]
+        full_set = sum(same_rank)
+        melds.append(full_set)
+        for card in same_rank:
+            melds.append(full_set ^ card)
+    return melds
+
+MELDS = tuple(_build_melds())
+
+
+def _lowest_card(mask):
+    """ Return lowest card int in mask """
+    return (mask & -mask).bit_length() - 1
+
+# Melds grouped by their lowest card, the only ones the solver needs to
+# try once every lower card has been settled
+MELDS_BY_CARD = tuple(tuple(meld for meld in MELDS
+                            if _lowest_card(meld) == card)
+                      for card in xrange(DECK_SIZE))
+
+
+def deadwood(hand):
+    """
+    Return minimum deadwood penalty of hand
+    hand: mask of cards (see cards.py)
+    """
+    return _solve(hand, {0: 0})
+
+
+def _solve(mask, memo):
+    """ Return minimum deadwood penalty of mask, memoized in memo """
+    best = memo.get(mask)
+    if best is not None:
+        return best
+    low = mask & -mask
+    card = low.bit_length() - 1
+    # lowest card as deadwood...
+    best = CARD_VALUES[card] + _solve(mask ^ low, memo)
+    # ...or as the start of any meld still fully in hand
+    for meld in MELDS_BY_CARD[card]:
+        if best == 0:
+            break
+        if meld & mask == meld:
+            penalty = _solve(mask ^ meld, memo)
+            if penalty < best:
+                best = penalty
+    memo[mask] = best
+    return best
+
+
+def best_discard(hand, deadline=None):
+    """
+    Return (card, penalty): the discard from hand leaving least deadwood,
+        and that deadwood (ties go to the higher-value discard)
+    hand: mask of cards (see cards.py), at least one card
+    deadline: optional time.time() after which SearchTimeout is raised
+    """
+    return _solve_discard(hand, {0: 0}, {}, deadline)
+
+
+def _solve_discard(mask, memo, discard_memo, deadline):
+    """
+    Return (card, penalty) of best discard from mask
+    memo: penalties without a discard (shared with _solve)
+    discard_memo: results of this function
+    """
+    best = discard_memo.get(mask)
+    if best is not None:
+        return best
+    if deadline is not None and time.time() > deadline:
+        raise SearchTimeout()
+    low = mask & -mask
+    card = low.bit_length() - 1
+    rest = mask ^ low
+    # lowest card as the discard...
+    best_card, best_penalty = card, _solve(rest, memo)
+    if rest:
+        options = [(CARD_VALUES[card], rest)]
+        options.extend((0, mask ^ meld) for meld in MELDS_BY_CARD[card]
+                       if meld & mask == meld and meld != mask)
+        # ...or as deadwood or the start of a meld, discarding later
+        for points, remaining in options:
+            discard, penalty = _solve_discard(remaining, memo,
+                                              discard_memo, deadline)
+            penalty += points
+            if penalty < best_penalty or (
+                    penalty == best_penalty and
+                    CARD_VALUES[discard] > CARD_VALUES[best_card]):
+                best_card, best_penalty = discard, penalty
+    discard_memo[mask] = (best_card, best_penalty)
+    return best_card, best_penalty
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+""" migrations.py - Handlers that rewrite stored entities in batches. """
+
+import logging
+import webapp2
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Game, Score, User, UserName, UserNameBackfill, \
+    normalize_name
+
+BATCH_SIZE = 100
+
+
+class migrate_games(webapp2.RequestHandler):
+    def get(self):
+        """
+        Start the Game storage migration (admin only, see app.yaml)
+        """
+        taskqueue.add(url='/tasks/migrate_games')
+        self.response.write('Game migration started')
+
+    def post(self):
+        """
+        Re-save one batch of Games, so deck, hands, draw_card and history
+        saved in an older format (pickled) are rewritten in the current
+        packed format, and players is filled in (see Game._pre_put_hook),
+        then queue the next batch. Each Game is read and saved in its own
+        transaction, so a move committed since the query isn't undone
+        Uses appEngine Push Queue; a failed batch is retried from its cursor
+        """
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = Cursor(urlsafe=self.request.get('cursor'))
+        keys, next_cursor, more = Game.query().fetch_page(
+            BATCH_SIZE, keys_only=True, start_cursor=cursor)
+
+        @ndb.transactional
+        def migrate(key):
+            game = key.get()
+            if game is not None:
+                game.put()
+
+        for key in keys:
+            migrate(key)
+        logging.info('Migrated %d games', len(keys))
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/migrate_games',
+                          params={'cursor': next_cursor.urlsafe()})
+
+
+class migrate_scores(webapp2.RequestHandler):
+    def get(self):
+        """
+        Start the Score players backfill (admin only, see app.yaml)
+        """
+        taskqueue.add(url='/tasks/migrate_scores')
+        self.response.write('Score migration started')
+
+    def post(self):
+        """
+        Re-save one batch of Scores, so Scores saved before players was
+        added get it (see Score._pre_put_hook), then queue the next batch
+        Each Score is read and saved in its own transaction, like Games in
+        migrate_games, so a write since the query isn't undone
+        """
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = Cursor(urlsafe=self.request.get('cursor'))
+        keys, next_cursor, more = Score.query().fetch_page(
+            BATCH_SIZE, keys_only=True, start_cursor=cursor)
+
+        @ndb.transactional
+        def migrate(key):
+            score = key.get()
+            if score is not None:
+                score.put()
+
+        for key in keys:
+            migrate(key)
+        logging.info('Migrated %d scores', len(keys))
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/migrate_scores',
+                          params={'cursor': next_cursor.urlsafe()})
+
+
+class migrate_user_names(webapp2.RequestHandler):
+    def get(self):
+        """
+        Start the UserName index backfill (admin only, see app.yaml)
+        """
+        taskqueue.add(url='/tasks/migrate_user_names')
+        self.response.write('User name migration started')
+
+    def post(self):
+        """
+        Add Users of one batch that are missing from the UserName index
+        (created before it), then queue the next batch. A name already
+        claimed keeps its first User. After the last batch, the index is
+        marked complete, so create_user is enabled and lookups stop
+        falling back to queries
+        """
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = Cursor(urlsafe=self.request.get('cursor'))
+        users, next_cursor, more = User.query().fetch_page(
+            BATCH_SIZE, start_cursor=cursor)
+        for user in users:
+            UserName.get_or_insert(normalize_name(user.name), user=user.key)
+        logging.info('Indexed %d user names', len(users))
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/migrate_user_names',
+                          params={'cursor': next_cursor.urlsafe()})
+        else:
+            UserNameBackfill.mark_complete()
+
+
+app = webapp2.WSGIApplication([
+    ('/tasks/migrate_games', migrate_games),
+    ('/tasks/migrate_scores', migrate_scores),
+    ('/tasks/migrate_user_names', migrate_user_names),
+], debug=True)
@@ -3,7 +3,13 @@
 #
 # models/__init__.py for Straight_Gin_API
 
-from .user import User, UserForm, UserForms, StringMessage
+from .user import User, UserName, UserNameBackfill, UserForm, UserForms, \
+    StringMessage, normalize_name
 from .game import Game, NewGameForm, GameForm, GameForms, GameHistoryForm, \
-    HandForm, MoveForm
+    HandForm, HandForms, MoveForm, MakeMoveForm, TurnForm
+from .alert import PendingAlert
+from .counter import StatShard, StatRollup
+from .leaderboard import Leaderboard, RankForm
+from .move import Move
+from .reminder import ReminderRun, ReminderBucket
 from .score import Score, ScoreForm, ScoreForms
@@ -0,0 +1,31 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# PendingAlert model for Straight_Gin_API
+
+from google.appengine.ext import ndb
+
+
+class PendingAlert(ndb.Model):
+    """
+    A game where it became user's turn, not yet e-mailed; sent in the
+        user's digest at the end of the alert window (see alerts.py),
+        then deleted
+    Child of the Game, keyed by alert window, so a move saves it in the
+        Game's own entity group (no read, no per-user entity) and each
+        game is pending once per window
+
+    Attributes:
+        user: user to alert
+    """
+    # only read by query, so ndb's memcache would just add a lock write
+    # and delete around every put
+    _use_memcache = False
+
+    user = ndb.KeyProperty(required=True, kind='User')
+
+    @classmethod
+    def due(cls, user, window):
+        """ Return user's PendingAlerts of window and earlier windows """
+        return [alert for alert in cls.query(cls.user == user)
+                if alert.key.id() <= window]
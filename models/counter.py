@@ -0,0 +1,92 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# sharded win/loss counters for Straight_Gin_API
+
+import random
+import constants
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+
+def stats_cache_key(user):
+    """ Return memcache key of user's aggregated (wins, losses) """
+    return 'user-stats:' + user.urlsafe()
+
+
+class StatShard(ndb.Model):
+    """
+    One of constants.STAT_SHARDS shards of a user's win/loss counters
+    A result is added to a random shard, in a transaction, so concurrent
+        games of a popular user rarely write the same entity; a user's
+        totals are the sums over all shards
+    Root entity keyed '<user urlsafe key>:<shard>' (not a child of the
+        User, which would put every shard in one entity group)
+
+    Attributes:
+        wins, losses: counts added to this shard
+        updated: last change, for the rollup (see rollups.py)
+    """
+    # summed totals are cached instead (stats_cache_key), so ndb's
+    # memcache would just add a lock write and delete around every put
+    _use_memcache = False
+
+    wins = ndb.IntegerProperty(default=0, indexed=False)
+    losses = ndb.IntegerProperty(default=0, indexed=False)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def shard_key(cls, user, shard):
+        """ Return key of user's shard number "shard" """
+        return ndb.Key(cls, '%s:%d' % (user.urlsafe(), shard))
+
+    @classmethod
+    def shard_keys(cls, user):
+        """ Return keys of all of user's shards """
+        return [cls.shard_key(user, shard)
+                for shard in xrange(constants.STAT_SHARDS)]
+
+    @classmethod
+    def user_of(cls, key):
+        """ Return User key of shard key """
+        return ndb.Key(urlsafe=key.id().rsplit(':', 1)[0])
+
+    @classmethod
+    @ndb.transactional_async(xg=True)
+    @ndb.tasklet
+    def add_result_async(cls, winner, loser):
+        """
+        Count a win for winner and a loss for loser, each in a random
+            shard (joins caller's transaction)
+        """
+        keys = [cls.shard_key(winner,
+                              random.randrange(constants.STAT_SHARDS)),
+                cls.shard_key(loser,
+                              random.randrange(constants.STAT_SHARDS))]
+        shards = yield ndb.get_multi_async(keys)
+        shards = [shard or cls(key=key) for shard, key in zip(shards, keys)]
+        shards[0].wins += 1
+        shards[1].losses += 1
+        yield ndb.put_multi_async(shards)
+        ndb.get_context().call_on_commit(
+            lambda: memcache.delete_multi([stats_cache_key(winner),
+                                           stats_cache_key(loser)]))
+
+    @classmethod
+    @ndb.tasklet
+    def totals_async(cls, user):
+        """ Return (wins, losses) summed over user's shards """
+        shards = yield ndb.get_multi_async(cls.shard_keys(user))
+        raise ndb.Return((sum(shard.wins for shard in shards if shard),
+                          sum(shard.losses for shard in shards if shard)))
+
+
+class StatRollup(ndb.Model):
+    """
+    State of the StatShard rollup (see rollups.py), keyed 'user_stats'
+
+    Attributes:
+        last_run: when the last rollup started; the next one rolls up
+            users with shards changed since then
+    """
+    last_run = ndb.DateTimeProperty(indexed=False)
@@ -4,97 +4,318 @@
 # Game model and forms for Straight_Gin_API
 
 import logging
+import pickle
+import cards
+import computer
 import constants
-from utils import deal_hand, test_hand
+import game_cache
+import packing
+from deck import Deck
+from rules import TAKE_VISIBLE, MOVE_FIRST, MOVE_TOOK_VISIBLE, \
+    MOVE_TOOK_HIDDEN, MOVE_DISCARD, winner_is_one
+from utils import deal_hand, test_hand, get_user_names
 from datetime import date
+from counter import StatShard
+from move import Move
 from score import Score, ScoreForm, ScoreForms
 from protorpc import messages
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
 
+# History text of each move code
+MOVE_TEXT = {MOVE_FIRST: 'goes first',
+             MOVE_TOOK_VISIBLE: 'took visible card',
+             MOVE_TOOK_HIDDEN: 'took hidden card',
+             MOVE_DISCARD: 'discards'}
+
+
+class CardMaskProperty(ndb.BlobProperty):
+    """
+    Collection of cards stored as a packed 52-bit mask (see cards.py,
+    packing.py). Values saved earlier were pickled lists of card names
+    (or pickled masks); those are converted when read
+    """
+    def _validate(self, value):
+        if not isinstance(value, (int, long)):
+            raise TypeError('Expected card mask, got %r' % (value,))
+
+    def _to_base_type(self, value):
+        return packing.pack_mask(value)
+
+    def _from_base_type(self, value):
+        if packing.is_packed(value):
+            return packing.unpack_mask(value)
+        value = pickle.loads(value)
+        if isinstance(value, list):
+            return cards.strings_to_mask(value)
+        return value
+
+
+class HistoryProperty(ndb.BlobProperty):
+    """
+    List of (player, move code, card) moves stored packed (see
+    packing.py). Values saved earlier were pickled lists of
+    (user_name, text); those are returned as-is and converted by
+    Game.upgrade_history before the Game is next saved
+    """
+    def _to_base_type(self, value):
+        return packing.pack_history(value)
+
+    def _from_base_type(self, value):
+        if packing.is_packed(value):
+            return packing.unpack_history(value)
+        return pickle.loads(value)
+
+
 class Game(ndb.Model):
     """
     Game object
 
     Attributes:
         player_one, player_two: users playing game
-        deck: deck of cards used in game, updated after every move
-        hand_one, hand_two: list of cards associated with each player
-        draw_card: "face-up" card, available for active player to take
+        players: both users, for one-query listings of a user's games
+            (filled in before every put, see _pre_put_hook)
+        seed, deck_offset: deck shuffled from seed, and number of cards
+            dealt from it so far (game can be replayed from seed)
+        deck: mask of cards left in deck (only games created before
+            seeded decks; None otherwise)
+        hand_one, hand_two: mask of cards associated with each player
+        draw_card: mask of "face-up" card, available for active player
+            to take (0 while active player holds it mid-move)
         active_player: user whose turn it is
         instructions: move-specific instructions
         mid_move: boolean reporting move state
             (set to True at end of 'start_move';
              set to False at end of 'end_move')
         game_over: boolean reporting game state
-        history: record of all moves
+        move_count: number of moves in the move log (Move entities,
+            children of the Game keyed by move number)
+        history: record of moves of games started before the move log, as
+            (player, move code, card) with player 0 for player_one and 1
+            for player_two; None for newer games
+        vs_computer: boolean reporting if player_two is the computer
+            opponent, which plays its turns right after player_one's
+        version: number of times the Game has been saved; identifies the
+            current copy in memcache (see game_cache.py)
     """
+    # Games are cached by game_cache.py (with versions), not by ndb
+    _use_memcache = False
+
     player_one = ndb.KeyProperty(required=True, kind='User')
     player_two = ndb.KeyProperty(required=True, kind='User')
-    deck = ndb.PickleProperty(required=True)
-    hand_one = ndb.PickleProperty(required=True)
-    hand_two = ndb.PickleProperty(required=True)
-    draw_card = ndb.PickleProperty(required=True)
+    players = ndb.KeyProperty(repeated=True, kind='User')
+    seed = ndb.IntegerProperty()
+    deck_offset = ndb.IntegerProperty()
+    deck = CardMaskProperty()
+    hand_one = CardMaskProperty(required=True)
+    hand_two = CardMaskProperty(required=True)
+    draw_card = CardMaskProperty(required=True)
     active_player = ndb.KeyProperty(required=True)
     instructions = ndb.StringProperty()
     mid_move = ndb.BooleanProperty(required=True, default=False)
     game_over = ndb.BooleanProperty(required=True, default=False)
-    history = ndb.PickleProperty(required=True)
+    move_count = ndb.IntegerProperty(default=0, indexed=False)
+    history = HistoryProperty()
+    vs_computer = ndb.BooleanProperty(default=False)
+    version = ndb.IntegerProperty(default=0, indexed=False)
 
     @classmethod
-    def new_game(cls, player_one, player_two):
-        """ Return a new game """
+    def new_game(cls, player_one, player_two, seed=None, vs_computer=False):
+        """
+        Return a new game
+        seed: optional deck seed, to replay a game; random if not given
+        vs_computer: True if player_two is the computer opponent
+        """
         game = Game(player_one=player_one,
                     player_two=player_two,
-                    active_player=player_one)
+                    players=[player_one, player_two],
+                    active_player=player_one,
+                    vs_computer=vs_computer)
 
-        # Prepare deck, hands, draw_card
-        # Note that deck is transformed and returned with each hand/card dealt
-        deck = constants.FULL_DECK
-        game.hand_one, deck = deal_hand(constants.HAND_SIZE, deck)
-        game.hand_two, deck = deal_hand(constants.HAND_SIZE, deck)
-        game.draw_card, game.deck = deal_hand(1, deck)
+        # Prepare deck, hands, draw_card from a fresh shuffled deck
+        deck = Deck(seed)
+        game.hand_one = deck.deal(constants.HAND_SIZE)
+        game.hand_two = deck.deal(constants.HAND_SIZE)
+        game.draw_card = deck.deal(1)
+        game.seed = deck.seed
+        game.deck_offset = deck.offset
 
-        # set up history
-        text_move = 'goes first'
-        game.history = []
-        game.history.append((player_one.get().name, text_move))
+        # start move log
+        game.log_move(0, MOVE_FIRST, None)
 
         game.put()
         return game
 
-    def game_to_form(self):
-        """ Return GameForm representation of Game """
+    def deal_from_deck(self):
+        """ Return mask of next card from deck, or None if deck is empty """
+        # games created before seeded decks keep a mask of remaining cards
+        if self.seed is None:
+            card, self.deck = deal_hand(1, self.deck)
+            return card
+        deck = Deck(self.seed, self.deck_offset)
+        card = deck.deal(1)
+        self.deck_offset = deck.offset
+        return card
+
+    def log_move(self, player, code, card):
+        """
+        Append (player, move code, card) to the move log
+        The new Move is written with the Game's next put (and only the new
+        Move: earlier moves are never rewritten)
+        """
+        self.move_count += 1
+        if not hasattr(self, '_new_moves'):
+            self._new_moves = []
+        self._new_moves.append((self.move_count, player, code, card))
+
+    def _new_move_entities(self):
+        """ Return (and forget) Move entities logged since last put """
+        moves = [Move(parent=self.key, id=number,
+                      player=player, code=code, card=card)
+                 for number, player, code, card
+                 in getattr(self, '_new_moves', [])]
+        self._new_moves = []
+        return moves
+
+    def active_index(self):
+        """ Return 0 if player_one is active player, 1 if player_two """
+        return 0 if self.active_player == self.player_one else 1
+
+    def active_hand(self):
+        """ Return mask of active player's hand """
+        if self.active_player == self.player_one:
+            return self.hand_one
+        return self.hand_two
+
+    def set_active_hand(self, hand):
+        """ Replace active player's hand with mask "hand" """
+        if self.active_player == self.player_one:
+            self.hand_one = hand
+        else:
+            self.hand_two = hand
+
+    def take_card(self, move):
+        """
+        Start active player's move; caller puts the Game
+        move: TAKE_VISIBLE or TAKE_HIDDEN
+        Return mask of card taken, or None if deck ran out (game ended)
+        """
+        # if player takes visible draw_card, deck isn't affected
+        if move == TAKE_VISIBLE:
+            card = self.draw_card
+            code = MOVE_TOOK_VISIBLE
+            self.draw_card = 0
+        # if player takes hidden card from deck, draw_card isn't affected
+        else:
+            card = self.deal_from_deck()
+            # but if out of cards, game automatically ends
+            if card is None:
+                self.end_game()
+                return None
+            code = MOVE_TOOK_HIDDEN
+        self.set_active_hand(self.active_hand() | card)
+        self.log_move(self.active_index(), code,
+                      card.bit_length() - 1 if card else None)
+        self.mid_move = True
+        return card
+
+    def discard_card(self, card, out=False):
+        """
+        Finish active player's move; caller puts the Game (unless over)
+        card: card int to discard, must be in active player's hand
+        out: True if player chooses to go "OUT"
+        """
+        # remove discard from hand and set as draw_card
+        self.set_active_hand(self.active_hand() & ~(1 << card))
+        self.draw_card = 1 << card
+        self.log_move(self.active_index(), MOVE_DISCARD, card)
+
+        # if player chooses to go "OUT", end game
+        if out:
+            self.end_game(True)
+        # otherwise switch active player
+        else:
+            if self.active_player == self.player_one:
+                self.active_player = self.player_two
+            else:
+                self.active_player = self.player_one
+            self.mid_move = False
+
+    def computer_to_move(self):
+        """ Return True if it is the computer opponent's turn """
+        return self.vs_computer and not self.game_over and \
+            self.active_player == self.player_two
+
+    def play_computer_turn(self):
+        """
+        Play computer opponent's whole turn (draw, discard, maybe "OUT")
+            within constants.COMPUTER_MOVE_BUDGET_MS; caller puts the Game
+        """
+        deadline = computer.deadline_after(constants.COMPUTER_MOVE_BUDGET_MS)
+        move = computer.choose_draw(self.active_hand(), self.draw_card,
+                                    deadline)
+        if self.take_card(move) is None:
+            return
+        card, out = computer.choose_discard(self.active_hand(), deadline)
+        self.discard_card(card, out)
+
+    def user_keys(self):
+        """ Return keys of both players (for get_user_names) """
+        return [self.player_one, self.player_two]
+
+    def game_to_form(self, names=None):
+        """
+        Return GameForm representation of Game
+        names: optional dict of User key -> name (see get_user_names)
+        """
+        names = get_user_names(self.user_keys(), names)
         # convert draw_card to string
-        string_card = ' '.join(self.draw_card)
+        string_card = cards.mask_to_text(self.draw_card)
 
         form = GameForm(urlsafe_key=self.key.urlsafe(),
-                        player_one=self.player_one.get().name,
-                        player_two=self.player_two.get().name,
+                        player_one=names[self.player_one],
+                        player_two=names[self.player_two],
                         draw_card=string_card,
                         mid_move=self.mid_move,
-                        game_over=self.game_over)
+                        game_over=self.game_over,
+                        version=self.version)
         if not self.game_over:
-            form.active_player = self.active_player.get().name
+            form.active_player = names[self.active_player]
         return form
 
-    def hand_to_form(self, player):
-        """ Return HandForm representation of player's hand """
+    @staticmethod
+    def not_modified_form(urlsafe, version):
+        """
+        Return GameForm telling a client its copy (version) is current;
+            only urlsafe_key, version and not_modified are set
+        """
+        return GameForm(urlsafe_key=urlsafe, version=version,
+                        not_modified=True)
+
+    def hand_to_form(self, player, names=None):
+        """
+        Return HandForm representation of player's hand
+        names: optional dict of User key -> name (see get_user_names)
+        """
         # retrieve correct hand
-        if player == self.player_one.get().name:
-            hand = self.hand_one
-        elif player == self.player_two.get().name:
-            hand = self.hand_two
-        elif player == "not_given":
+        if player == "not_given":
+            # the active player's hand only needs the active player's name
+            names = get_user_names([self.active_player], names)
             if self.active_player == self.player_one:
                 hand = self.hand_one
             else:
                 hand = self.hand_two
+        else:
+            names = get_user_names(self.user_keys(), names)
+            if player == names[self.player_one]:
+                hand = self.hand_one
+            elif player == names[self.player_two]:
+                hand = self.hand_two
 
-        # convert hand (sorted) & draw_card to strings
-        sorted_hand = sorted(hand)
-        string_hand = ' '.join(str(card) for card in sorted_hand)
-        string_card = ' '.join(self.draw_card)
+        # convert hand (sorted by suit, then rank) & draw_card to strings
+        string_hand = cards.mask_to_text(hand)
+        string_card = cards.mask_to_text(self.draw_card)
 
         # return proper instructions
         if self.game_over:
@@ -108,7 +329,7 @@ class Game(ndb.Model):
 
         form = HandForm(urlsafe_key=self.key.urlsafe(),
                         mid_move=self.mid_move,
-                        active_player=self.active_player.get().name,
+                        active_player=names[self.active_player],
                         hand=string_hand,
                         draw_card=string_card,
                         instructions=instructions)
@@ -118,43 +339,38 @@ class Game(ndb.Model):
         """
         End game and determine winner -
         chosen: boolean representing if active player chose to go "OUT"
+        Score, players' counters and the Game are written in parallel
         """
-        # check both players' hands
+        # check both players' hands (best arrangement of runs and sets)
         penalty_one = test_hand(self.hand_one)
         penalty_two = test_hand(self.hand_two)
 
-        # if game ended because no more cards to draw
-        if not chosen:
-            # winner is player with lower penalty
-            if penalty_one < penalty_two:
-                score_game(self.player_one, penalty_one, penalty_two)
-            elif penalty_two < penalty_one:
-                score_game(self.player_two, penalty_two, penalty_one)
-            # and penalty tie goes to active player
-            else:
-                score_game(self.active_player, penalty_one, penalty_two)
-
-        # if game ended because active player signaled "OUT"
-        # active player needs penalty of 0 to win
+        active_is_one = self.active_player == self.player_one
+        if winner_is_one(penalty_one, penalty_two, active_is_one, chosen):
+            scored = self.score_game_async(self.player_one, penalty_one,
+                                           penalty_two)
         else:
-            if self.active_player == self.player_one:
-                if penalty_one == 0:
-                    self.score_game(self.player_one, penalty_one, penalty_two)
-                else:
-                    self.score_game(self.player_two, penalty_two, penalty_one)
-            else:
-                if penalty_two == 0:
-                    self.score_game(self.player_two, penalty_two, penalty_one)
-                else:
-                    self.score_game(self.player_one, penalty_one, penalty_two)
+            scored = self.score_game_async(self.player_two, penalty_two,
+                                           penalty_one)
 
         self.mid_move = False
         self.game_over = True
-        self.put()
+        saved = self.put_async()
+        scored.check_success()
+        saved.check_success()
         return
 
     def score_game(self, winner, penalty_winner, penalty_loser):
         """ Set up Score for Game """
+        self.score_game_async(winner, penalty_winner,
+                              penalty_loser).check_success()
+
+    @ndb.tasklet
+    def score_game_async(self, winner, penalty_winner, penalty_loser):
+        """
+        Tasklet version of score_game: Score is written while the win and
+            loss are counted in the players' StatShards
+        """
         if winner == self.player_one:
             loser = self.player_two
         else:
@@ -164,14 +380,105 @@ class Game(ndb.Model):
                       game=self.key,
                       winner=winner,
                       loser=loser,
+                      players=[winner, loser],
                       penalty_winner=penalty_winner,
                       penalty_loser=penalty_loser)
-        score.put()
 
-        # Update the user models
-        winner.get().add_win()
-        loser.get().add_loss()
-        return
+        # Update the users' counters (User totals follow at next rollup)
+        yield score.put_async(), StatShard.add_result_async(winner, loser)
+        # and the high score leaderboards (only if game's end commits)
+        taskqueue.add(url='/tasks/leaderboards',
+                      params={'score': score.key.urlsafe()},
+                      transactional=ndb.in_transaction())
+
+    def move_to_text(self, move, names):
+        """
+        Return history entry as text, i.e. 'jen discards D-K'
+        names: dict of User key -> name (see get_user_names)
+        """
+        # saved before packed storage, not yet upgraded
+        if len(move) == 2:
+            return '%s %s' % move
+        player, code, card = move
+        name = names[self.player_two if player else self.player_one]
+        text = '%s %s' % (name, MOVE_TEXT[code])
+        if card is not None:
+            text += ' ' + cards.card_to_str(card)
+        return text
+
+    def upgrade_history(self):
+        """
+        Convert history entries saved before packed storage,
+            (user_name, text), to (player, move code, card)
+        """
+        names = get_user_names(self.user_keys())
+        moves = []
+        for move in self.history:
+            if len(move) == 3:
+                moves.append(move)
+                continue
+            name, text = move
+            for code, prefix in MOVE_TEXT.iteritems():
+                if text.startswith(prefix):
+                    break
+            else:
+                logging.warning('Dropping unknown history entry %r', move)
+                continue
+            try:
+                card = cards.str_to_card(text[len(prefix):])
+            except ValueError:
+                card = None
+            player = 0 if name == names[self.player_one] else 1
+            moves.append((player, code, card))
+        self.history = moves
+
+    def _pre_put_hook(self):
+        """
+        Save everything read in an older format in packed format (and
+            fill in players), start writing new moves alongside the Game,
+            and bump version
+        """
+        self.version += 1
+        self.players = self.user_keys()
+        # reading a property converts it, so it is written back packed
+        for name in ('deck', 'hand_one', 'hand_two', 'draw_card'):
+            getattr(self, name)
+        if any(len(move) == 2 for move in self.history or []):
+            self.upgrade_history()
+        # a new Game has no complete key yet (ndb gives it one without an
+        # id); its moves are written after it
+        self._move_futures = []
+        if self.key.id() is not None:
+            self._move_futures = ndb.put_multi_async(
+                self._new_move_entities())
+
+    def _post_put_hook(self, future):
+        """
+        Finish writing moves logged since last put, then write Game through
+            to memcache (after commit, if saved in a transaction)
+        """
+        if self._move_futures:
+            ndb.Future.wait_all(self._move_futures)
+        elif future.get_exception() is None:
+            ndb.put_multi(self._new_move_entities())
+        if future.get_exception() is None:
+            ndb.get_context().call_on_commit(lambda: game_cache.store(self))
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        """ Drop deleted Game from memcache """
+        game_cache.evict(key)
+
+    def all_moves(self):
+        """
+        Return iterator over every move of the Game, in order:
+            history (games started before the move log), then move log
+        Move log is streamed from the datastore in batches
+        """
+        for move in self.history or []:
+            yield move
+        for move in Move.log_query(self.key).iter(batch_size=100):
+            yield move.to_tuple()
 
     def history_to_form(self):
         """
@@ -179,37 +486,63 @@ class Game(ndb.Model):
         Assistance with list[tuples]->list[str]:
         http://stackoverflow.com/questions/11696078/python-converting-a-list-of-tuples-to-a-list-of-strings
         """
-        history_list = ['%s %s' % x for x in self.history]
-        history = '; '.join(str(move) for move in history_list)
+        names = get_user_names(self.user_keys())
+        # text of each move is built as the log is read
+        history = '; '.join(self.move_to_text(move, names)
+                            for move in self.all_moves())
 
         history_form = GameHistoryForm(urlsafe_key=self.key.urlsafe(),
-                               player_one=self.player_one.get().name,
-                               player_two=self.player_two.get().name,
+                               player_one=names[self.player_one],
+                               player_two=names[self.player_two],
                                game_over=self.game_over,
                                history=history)
         return history_form
 
 
 class NewGameForm(messages.Message):
-    """ Used to create a new game """
+    """
+    Used to create a new game
+    (player_two not needed when playing against the computer)
+    """
     player_one = messages.StringField(1, required=True)
-    player_two = messages.StringField(2, required=True)
+    player_two = messages.StringField(2)
+    vs_computer = messages.BooleanField(3, default=False)
 
 
 class GameForm(messages.Message):
-    """ GameForm for outbound game state information """
+    """
+    GameForm for outbound game state information
+    (state fields are left out when not_modified, see get_game)
+    """
     urlsafe_key = messages.StringField(1, required=True)
-    player_one = messages.StringField(2, required=True)
-    player_two = messages.StringField(3, required=True)
+    player_one = messages.StringField(2)
+    player_two = messages.StringField(3)
     active_player = messages.StringField(4)
-    draw_card = messages.StringField(5, required=True)
-    mid_move = messages.BooleanField(6, required=True)
-    game_over = messages.BooleanField(7, required=True)
+    draw_card = messages.StringField(5)
+    mid_move = messages.BooleanField(6)
+    game_over = messages.BooleanField(7)
+    version = messages.IntegerField(8)
+    not_modified = messages.BooleanField(9, default=False)
+
+
+class MakeMoveForm(messages.Message):
+    """ Used to play a whole turn in one request """
+    user_name = messages.StringField(1, required=True)
+    draw = messages.StringField(2, required=True)
+    discard = messages.StringField(3, required=True)
+    out = messages.BooleanField(4, default=False)
+
+
+class TurnForm(messages.Message):
+    """ TurnForm for outbound result of a whole turn """
+    drawn_card = messages.StringField(1)
+    game = messages.MessageField(GameForm, 2, required=True)
 
 
 class GameForms(messages.Message):
     """Container for multiple GameForm"""
     items = messages.MessageField(GameForm, 1, repeated=True)
+    next_page_token = messages.StringField(2)
 
 
 class HandForm(messages.Message):
@@ -222,6 +555,11 @@ class HandForm(messages.Message):
     instructions = messages.StringField(6, required=True)
 
 
+class HandForms(messages.Message):
+    """ Container for multiple HandForm """
+    items = messages.MessageField(HandForm, 1, repeated=True)
+
+
 class GameHistoryForm(messages.Message):
     """ GameHistoryForm for detailed game information """
     urlsafe_key = messages.StringField(1, required=True)
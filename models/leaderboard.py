@@ -0,0 +1,208 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# Leaderboard model and forms for Straight_Gin_API
+
+import constants
+from datetime import date
+from utils import get_player_names
+from score import Score, ScoreForm
+from user import User, UserForm
+from protorpc import messages
+from google.appengine.ext import ndb
+
+# Board of highest win rates (kept by the stats rollup, see rollups.py)
+RANKINGS = 'rankings'
+# Boards of lowest winner penalties: all time, per day, per ISO week
+SCORE_WINDOWS = ('all', 'day', 'week')
+
+
+def score_board_name(window, day=None):
+    """ Return name of high score board of window ('all', 'day', 'week') """
+    day = day or date.today()
+    if window == 'all':
+        return 'scores'
+    if window == 'day':
+        return 'scores:day:' + day.isoformat()
+    if window == 'week':
+        return 'scores:week:%d-W%02d' % day.isocalendar()[:2]
+    raise ValueError('Unknown window %r' % (window,))
+
+
+def score_entry(score, names):
+    """
+    Return board entry of Score (the fields of its ScoreForm)
+    names: dict of User key -> name (see get_user_names)
+    """
+    return {'score': score.key.urlsafe(),
+            'date': str(score.date),
+            'winner': names[score.winner],
+            'loser': names[score.loser],
+            'penalty_winner': score.penalty_winner,
+            'penalty_loser': score.penalty_loser}
+
+
+def ranking_entry(user):
+    """
+    Return board entry of User (the fields of its UserForm); win_rate is
+        the stored one, which the rankings query orders by
+    """
+    return {'user': user.key.urlsafe(),
+            'name': user.name,
+            'email': user.email,
+            'total_games': user.total_games,
+            'win_rate': user.win_rate}
+
+
+def entry_to_form(entry):
+    """ Return ScoreForm or UserForm of board entry (entities as is) """
+    if not isinstance(entry, dict):
+        return entry
+    if 'score' in entry:
+        return ScoreForm(date=entry['date'],
+                         winner=entry['winner'],
+                         loser=entry['loser'],
+                         penalty_winner=entry['penalty_winner'],
+                         penalty_loser=entry['penalty_loser'])
+    return UserForm(name=entry['name'],
+                    email=entry['email'],
+                    total_games=entry['total_games'],
+                    win_rate=entry['win_rate'])
+
+
+# sort key of entries (best first) and field identifying an entry, by board
+ORDER = {'scores': (lambda entry: (entry['penalty_winner'], entry['date']),
+                    'score'),
+         RANKINGS: (lambda entry: (-entry['win_rate'], entry['name']),
+                    'user')}
+
+
+class Leaderboard(ndb.Model):
+    """
+    Top constants.LEADERBOARD_SIZE entries of one board, best first
+    Keyed by board name: RANKINGS, or a high score board (see
+        score_board_name); read as one small entity (cached by ndb)
+
+    Attributes:
+        entries: list of dicts, each holding the fields of the form it is
+            shown as (ScoreForm or UserForm) plus the key it came from
+    """
+    entries = ndb.JsonProperty(default=[])
+
+    def kind_of_board(self):
+        """ Return 'scores' or RANKINGS """
+        return self.key.id().split(':')[0]
+
+    def merge(self, entries, remove=(), keep_existing=False):
+        """
+        Add entries (replacing entries of the same Score/User), drop
+            entries whose Score/User is in remove, and keep the best
+            constants.LEADERBOARD_SIZE
+        keep_existing: True to only add entries of Scores/Users not on
+            the board yet (i.e. entries from a possibly stale query)
+        """
+        order, field = ORDER[self.kind_of_board()]
+        if keep_existing:
+            known = set(entry[field] for entry in self.entries)
+            entries = [entry for entry in entries if entry[field] not in known]
+        replaced = set(remove) | set(entry[field] for entry in entries)
+        merged = [entry for entry in self.entries
+                  if entry[field] not in replaced] + list(entries)
+        merged.sort(key=order)
+        self.entries = merged[:constants.LEADERBOARD_SIZE]
+
+    def key_field(self):
+        """ Return entry field holding the key of its Score/User """
+        return ORDER[self.kind_of_board()][1]
+
+    def rest_query(self):
+        """
+        Return query of the Scores/Users after this board, in the order
+            of its entries, or None if there are none: a board that isn't
+            full holds every entry there is, and day and week boards are
+            only kept as far as their top
+        Starts at the value of the last entry (ties with it may be on the
+            board; board_page skips those by key)
+        """
+        name = self.key.id()
+        if name not in ('scores', RANKINGS) or \
+                len(self.entries) < constants.LEADERBOARD_SIZE:
+            return None
+        last = self.entries[-1]
+        if name == RANKINGS:
+            return User.query(User.win_rate <= last['win_rate']).order(
+                -User.win_rate)
+        return Score.query(
+            Score.penalty_winner >= last['penalty_winner']).order(
+                Score.penalty_winner)
+
+    def rank_of(self, field, value):
+        """
+        Return (1-based rank, entry) of best entry whose field is value,
+            or (None, None) if not on board
+        """
+        for rank, entry in enumerate(self.entries, 1):
+            if entry[field] == value:
+                return rank, entry
+        return None, None
+
+    @classmethod
+    def get_board(cls, name):
+        """
+        Return board by name; the all-time boards ('scores', RANKINGS)
+            are built from a query the first time (i.e. on existing data),
+            others start empty
+        """
+        board = ndb.Key(cls, name).get()
+        if board is None:
+            board = cls(id=name)
+            if name in ('scores', RANKINGS):
+                board = cls.rebuild(name)
+        return board
+
+    @classmethod
+    def rebuild(cls, name):
+        """
+        Merge the top of the query into all-time board ('scores' or
+            RANKINGS) and save it, in a transaction; entries already on
+            the board are kept, since update merged them after the
+            (eventually consistent) query may have been answered
+        """
+        size = constants.LEADERBOARD_SIZE
+        if name == RANKINGS:
+            users = User.query().order(-User.win_rate).fetch(
+                size, projection=User.FORM_FIELDS)
+            entries = [ranking_entry(user) for user in users]
+        else:
+            scores = Score.query().order(Score.penalty_winner).fetch(size)
+            names = get_player_names(scores)
+            entries = [score_entry(score, names) for score in scores]
+
+        @ndb.transactional
+        def save():
+            board = ndb.Key(cls, name).get() or cls(id=name)
+            board.merge(entries, keep_existing=True)
+            board.put()
+            return board
+        return save()
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def update(cls, names, entries, remove=()):
+        """ Merge entries into each board in names, in one transaction """
+        keys = [ndb.Key(cls, name) for name in names]
+        boards = [board or cls(key=key)
+                  for board, key in zip(ndb.get_multi(keys), keys)]
+        for board in boards:
+            board.merge(entries, remove)
+        ndb.put_multi(boards)
+        return boards
+
+
+class RankForm(messages.Message):
+    """ RankForm for outbound rank of a user on a leaderboard """
+    user_name = messages.StringField(1, required=True)
+    board = messages.StringField(2, required=True)
+    rank = messages.IntegerField(3)
+    win_rate = messages.FloatField(4)
+    penalty_winner = messages.IntegerField(5)
@@ -0,0 +1,36 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# Move model for Straight_Gin_API
+
+from google.appengine.ext import ndb
+
+
+class Move(ndb.Model):
+    """
+    One entry of a Game's append-only move log
+    Child of its Game, keyed by move number (1 = first move), so each move
+    is written once and never rewritten, and an ancestor query ordered by
+    key reads the log in order
+
+    Attributes:
+        player: 0 for player_one, 1 for player_two
+        code: move code (see rules.py)
+        card: card int of the move (see cards.py), None if no card
+    """
+    # only read by ancestor query, so ndb's memcache would just add a lock
+    # write and delete around every put
+    _use_memcache = False
+
+    player = ndb.IntegerProperty(required=True, indexed=False)
+    code = ndb.IntegerProperty(required=True, indexed=False)
+    card = ndb.IntegerProperty(indexed=False)
+
+    @classmethod
+    def log_query(cls, game_key):
+        """ Return query for a Game's moves, in order """
+        return cls.query(ancestor=game_key).order(cls.key)
+
+    def to_tuple(self):
+        """ Return move as (player, code, card), as Game.move_to_text """
+        return self.player, self.code, self.card
@@ -0,0 +1,46 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# Reminder bookkeeping models for Straight_Gin_API
+
+from google.appengine.ext import ndb
+
+
+class ReminderRun(ndb.Model):
+    """
+    One run of the daily game reminder (see emails.py), keyed by date
+    Each task of the run updates it in the same transaction as its
+    ReminderBuckets, so it also reports the run's progress
+
+    Attributes:
+        state: 'scanning' games, 'sending' e-mails, or 'done'
+        batches: number of task batches committed so far
+        games: number of in-progress games scanned
+        sent: number of reminder e-mails sent
+        started, finished: when run started and finished
+    """
+    state = ndb.StringProperty(required=True, default='scanning')
+    batches = ndb.IntegerProperty(default=0, indexed=False)
+    games = ndb.IntegerProperty(default=0, indexed=False)
+    sent = ndb.IntegerProperty(default=0, indexed=False)
+    started = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+    finished = ndb.DateTimeProperty(indexed=False)
+
+
+class ReminderBucket(ndb.Model):
+    """
+    In-progress games of one player for one ReminderRun, gathered while
+        scanning Games; deleted once the player's e-mail is sent
+    Child of its ReminderRun, keyed by the player's urlsafe key
+
+    Attributes:
+        user: player to remind
+        games: urlsafe keys of player's in-progress games
+    """
+    user = ndb.KeyProperty(required=True, kind='User', indexed=False)
+    games = ndb.StringProperty(repeated=True, indexed=False)
+
+    @classmethod
+    def key_for(cls, run_key, user):
+        """ Return key of player's bucket in run """
+        return ndb.Key(cls, user.urlsafe(), parent=run_key)
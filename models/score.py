@@ -5,23 +5,51 @@
 
 import logging
 from datetime import date
+from utils import get_user_names
 from protorpc import messages
 from google.appengine.ext import ndb
 
 
 class Score(ndb.Model):
-    """ Score object """
+    """
+    Score object
+    players: winner and loser, for one-query listings of a user's scores
+        (filled in before every put)
+    """
+    # written once and read by query (the leaderboard task's one get
+    # follows the put, which only clears memcache), so ndb's memcache
+    # would just add a lock write and delete around the put
+    _use_memcache = False
+
     date = ndb.DateProperty(required=True)
     game = ndb.KeyProperty(required=True, kind="Game")
     winner = ndb.KeyProperty(required=True, kind="User")
     loser = ndb.KeyProperty(required=True, kind="User")
+    players = ndb.KeyProperty(repeated=True, kind="User")
     penalty_winner = ndb.IntegerProperty(required=True)
     penalty_loser = ndb.IntegerProperty(required=True)
 
-    def score_to_form(self):
+    # Properties needed by score_to_form (for projection queries)
+    FORM_FIELDS = ('date', 'winner', 'loser', 'penalty_winner',
+                   'penalty_loser')
+
+    def user_keys(self):
+        """ Return keys of both players (for get_user_names) """
+        return [self.winner, self.loser]
+
+    def _pre_put_hook(self):
+        """ Fill in players (Scores saved before it was added lack it) """
+        self.players = self.user_keys()
+
+    def score_to_form(self, names=None):
+        """
+        Return ScoreForm representation of Score
+        names: optional dict of User key -> name (see get_user_names)
+        """
+        names = get_user_names(self.user_keys(), names)
         return ScoreForm(date=str(self.date),
-                         winner=self.winner.get().name,
-                         loser=self.loser.get().name,
+                         winner=names[self.winner],
+                         loser=names[self.loser],
                          penalty_winner=self.penalty_winner,
                          penalty_loser=self.penalty_loser)
 
@@ -38,6 +66,7 @@ class ScoreForm(messages.Message):
 class ScoreForms(messages.Message):
     """ Return multiple ScoreForms """
     items = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_page_token = messages.StringField(2)
 
 
 class StringMessage(messages.Message):
@@ -4,62 +4,262 @@
 # User model and forms for Straight_Gin_API
 
 import logging
+import constants
+from counter import StatShard, stats_cache_key
 from game import Game
 from score import Score, ScoreForm, ScoreForms
 from protorpc import messages
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 
 
+def normalize_name(name):
+    """ Return user name as compared for uniqueness and lookup """
+    return name.strip().lower()
+
+
+# memcache key of the flag set once the UserName index is complete
+NAMES_INDEXED_KEY = 'user-names-indexed'
+
+
+def name_cache_key(name):
+    """ Return memcache key of name -> User key map entry """
+    return 'user-name:' + normalize_name(name).encode('utf-8')
+
+
 class User(ndb.Model):
-    """ User profile """
+    """
+    User profile
+    wins, total_games and win_rate are kept up to date from the user's
+        StatShards by the rollup cron (see rollups.py); before a user's
+        first rollup (stats_seeded False) they hold the totals counted
+        before sharded counters, which the rollup adds to the shards
+    """
     name = ndb.StringProperty(required=True)
     email = ndb.StringProperty()
     total_games = ndb.IntegerProperty(default=0)
     wins = ndb.IntegerProperty(default=0)
     win_rate = ndb.FloatProperty(default=0.0)
+    stats_seeded = ndb.BooleanProperty(default=False, indexed=False)
+
+    # Properties needed by user_to_form (for projection queries)
+    FORM_FIELDS = ('name', 'email', 'total_games', 'wins', 'win_rate')
+
+    @classmethod
+    def by_name(cls, name):
+        """
+        Return User with name (compared normalized), or None
+        Looks up name -> User key in memcache, then the UserName index
+            (both gets by key, strongly consistent); until the index is
+            complete (see UserName.index_complete_async), users created
+            before it are found by query once and added to it
+        """
+        return cls.by_name_async(name).get_result()
+
+    @classmethod
+    @ndb.tasklet
+    def by_name_async(cls, name):
+        """ Tasklet version of by_name (lookups of many names overlap) """
+        if not name:
+            raise ndb.Return(None)
+        if normalize_name(name) == normalize_name(constants.COMPUTER_NAME):
+            user = yield cls.computer_async()
+            raise ndb.Return(user)
+        context = ndb.get_context()
+        urlsafe = yield context.memcache_get(name_cache_key(name))
+        if urlsafe:
+            user = yield ndb.Key(urlsafe=urlsafe).get_async()
+            raise ndb.Return(user)
+        index = yield UserName.get_by_id_async(normalize_name(name))
+        if index:
+            user = yield index.user.get_async()
+        else:
+            complete = yield UserName.index_complete_async()
+            if complete:
+                raise ndb.Return(None)
+            # names were stored as entered, so match the name as given
+            # and as normalized (other spellings wait for the backfill)
+            names = list(set([name, name.strip(), normalize_name(name)]))
+            user = yield cls.query(cls.name.IN(names)).get_async()
+            if user is None:
+                raise ndb.Return(None)
+            yield UserName.get_or_insert_async(normalize_name(name),
+                                               user=user.key)
+        yield context.memcache_set(name_cache_key(name), user.key.urlsafe())
+        raise ndb.Return(user)
+
+    @classmethod
+    def create(cls, name, email=None):
+        """
+        Create User and claim its name in the UserName index, in one
+            transaction; return None if the name is already taken
+        Callers must check UserName.index_complete_async() first: before
+            that, a user created before the index under another spelling
+            of the name (i.e. "Alice" for "alice") can't be found
+        """
+        # users created before the index are only found by query, which
+        # can't run inside the transaction (adds them to the index)
+        if cls.by_name(name):
+            return None
+
+        @ndb.transactional(xg=True)
+        def claim():
+            if UserName.get_by_id(normalize_name(name)):
+                return None
+            user = cls(name=name, email=email)
+            user.put()
+            UserName(id=normalize_name(name), user=user.key).put()
+            return user
+        user = claim()
+        if user:
+            memcache.set(name_cache_key(name), user.key.urlsafe())
+        return user
+
+    @classmethod
+    def computer(cls):
+        """ Return User playing as computer opponent (created if needed) """
+        return cls.computer_async().get_result()
 
-    def user_to_form(self):
-        """ Populate UserForm """
+    @classmethod
+    def computer_async(cls):
+        """ Return Future of computer opponent's User """
+        return cls.get_or_insert_async('computer',
+                                       name=constants.COMPUTER_NAME)
+
+    def user_to_form(self, live=False):
+        """
+        Populate UserForm
+        live: True for current counts (see live_stats) rather than as of
+            the last rollup
+        """
+        wins, total_games = self.wins, self.total_games
+        if live:
+            wins, total_games = self.live_stats()
         return UserForm(name=self.name,
                         email=self.email,
-                        total_games=self.total_games,
-                        win_rate=self.calc_win_rate())
+                        total_games=total_games,
+                        win_rate=self.calc_win_rate(wins, total_games))
 
     def all_games(self):
         """
         Return all user games - in progress and complete
-        Reference: http://stackoverflow.com/questions/24392270/many-to-many-relationship-in-ndb
+        (one query on Game.players rather than an OR of player_one and
+        player_two, so it can be ordered and paged with cursors)
         """
-        return Game.query(ndb.OR(Game.player_one == self.key,
-                                 Game.player_two == self.key))
+        return Game.query(Game.players == self.key)
 
     def all_scores(self):
         """ Return all user scores - only from completed games """
-        return Score.query(ndb.OR(Score.winner == self.key,
-                                  Score.loser == self.key))
+        return Score.query(Score.players == self.key)
 
-    def calc_win_rate(self):
-        """ Calculate win rate """
-        if self.total_games > 0:
-            win_rate = float(self.wins)/float(self.total_games)
+    def calc_win_rate(self, wins=None, total_games=None):
+        """ Calculate win rate (of User's wins/total_games if not given) """
+        if wins is None:
+            wins, total_games = self.wins, self.total_games
+        if total_games > 0:
+            win_rate = float(wins)/float(total_games)
         else:
             win_rate = 0.0
         return win_rate
 
-    def add_win(self):
-        """ Add a win """
-        self.wins += 1
-        self.total_games += 1
-        self.win_rate = self.calc_win_rate()
-        self.put()
-        return
+    def live_stats(self):
+        """
+        Return (wins, total_games) as of now: sum of StatShards (plus
+            totals from before shards, until first rollup), cached in
+            memcache for constants.STATS_CACHE_SECONDS
+        """
+        cached = memcache.get(stats_cache_key(self.key))
+        if cached is None:
+            cached = StatShard.totals_async(self.key).get_result()
+            memcache.set(stats_cache_key(self.key), cached,
+                         time=constants.STATS_CACHE_SECONDS)
+        wins, losses = cached
+        if not self.stats_seeded:
+            wins, losses = wins + self.wins, losses + (self.total_games -
+                                                      self.wins)
+        return wins, wins + losses
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def rollup_stats(cls, key):
+        """
+        Set wins, total_games and win_rate of User from its StatShards
+        The first rollup adds the totals counted before shards to shard 0
+        """
+        keys = StatShard.shard_keys(key)
+        user, shards = key.get(), ndb.get_multi(keys)
+        if not user.stats_seeded:
+            shards[0] = shards[0] or StatShard(key=keys[0])
+            shards[0].wins += user.wins
+            shards[0].losses += user.total_games - user.wins
+            shards[0].put()
+            user.stats_seeded = True
+        wins = sum(shard.wins for shard in shards if shard)
+        losses = sum(shard.losses for shard in shards if shard)
+        user.wins = wins
+        user.total_games = wins + losses
+        user.win_rate = user.calc_win_rate()
+        user.put()
+        ndb.get_context().call_on_commit(
+            lambda: memcache.delete(stats_cache_key(key)))
+        return user
+
+
+class UserName(ndb.Model):
+    """
+    Index of user names: keyed by normalized name (see normalize_name),
+        points to the User with that name, so names are unique and a name
+        is looked up with a get instead of a query
+    """
+    user = ndb.KeyProperty(required=True, kind='User', indexed=False)
+
+    @classmethod
+    @ndb.tasklet
+    def index_complete_async(cls):
+        """
+        Return True once every User is in the index: migrate_user_names
+            has finished, or there were no Users when it was first needed
+        The answer is kept in memcache (an incomplete index only for
+            constants.NAMES_INDEX_CHECK_SECONDS), so callers don't read
+            the datastore each time
+        """
+        global _names_indexed
+        if _names_indexed:
+            raise ndb.Return(True)
+        context = ndb.get_context()
+        complete = yield context.memcache_get(NAMES_INDEXED_KEY)
+        if complete is None:
+            marker = yield UserNameBackfill.get_by_id_async('user_names')
+            complete = marker is not None
+            if not complete:
+                user = yield User.query().get_async(keys_only=True)
+                if user is None:
+                    # new datastore: every User is created with its UserName
+                    yield UserNameBackfill(id='user_names').put_async()
+                    complete = True
+            yield context.memcache_set(
+                NAMES_INDEXED_KEY, complete,
+                time=0 if complete else constants.NAMES_INDEX_CHECK_SECONDS)
+        _names_indexed = complete
+        raise ndb.Return(complete)
+
+
+class UserNameBackfill(ndb.Model):
+    """
+    Marks the UserName index complete (keyed 'user_names'); written when
+        migrate_user_names finishes
+    """
+    finished = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+    @classmethod
+    def mark_complete(cls):
+        """ Write the marker and the memcache flag read before it """
+        cls.get_or_insert('user_names')
+        memcache.set(NAMES_INDEXED_KEY, True)
+
 
-    def add_loss(self):
-        """ Add a loss """
-        self.total_games += 1
-        self.win_rate = self.calc_win_rate()
-        self.put()
-        return
+# set once the UserName index is known to be complete (never unset)
+_names_indexed = False
 
 
 class UserForm(messages.Message):
@@ -73,6 +273,7 @@ class UserForm(messages.Message):
 class UserForms(messages.Message):
     """ Container for multiple User Forms """
     items = messages.MessageField(UserForm, 1, repeated=True)
+    next_page_token = messages.StringField(2)
 
 
 class StringMessage(messages.Message):
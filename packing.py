@@ -0,0 +1,62 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# compact binary storage format for Straight_Gin_API
+#
+# Every packed value starts with a format version byte, so the layout can
+# change later and values saved by older code can still be read. Values
+# saved before packing were pickled; pickle protocol 2 output starts with
+# '\x80', which is never a version byte, so is_packed() tells them apart.
+#
+# Version 1 layouts:
+#   card mask: version byte + 7 bytes, little-endian (52 bits used)
+#   history:   version byte + 3 bytes per move: player (0 = player_one,
+#              1 = player_two), move code (see rules.py), card (NO_CARD if
+#              the move has none)
+
+import struct
+
+FORMAT_VERSION = 1
+MASK_BYTES = 7
+NO_CARD = 0xFF
+
+_MASK = struct.Struct('<BQ')
+_MOVE = struct.Struct('BBB')
+
+
+def is_packed(data):
+    """ Return True if data was written by this module """
+    return bool(data) and ord(data[0]) == FORMAT_VERSION
+
+
+def pack_mask(mask):
+    """ Return card mask as packed bytes """
+    return _MASK.pack(FORMAT_VERSION, mask)[:1 + MASK_BYTES]
+
+
+def unpack_mask(data):
+    """ Return card mask from packed bytes """
+    _check_version(data)
+    return _MASK.unpack(data.ljust(_MASK.size, '\0'))[1]
+
+
+def pack_history(moves):
+    """ Return list of (player, code, card) moves as packed bytes """
+    return chr(FORMAT_VERSION) + ''.join(
+        _MOVE.pack(player, code, NO_CARD if card is None else card)
+        for player, code, card in moves)
+
+
+def unpack_history(data):
+    """ Return list of (player, code, card) moves from packed bytes """
+    _check_version(data)
+    moves = []
+    for offset in xrange(1, len(data), _MOVE.size):
+        player, code, card = _MOVE.unpack_from(data, offset)
+        moves.append((player, code, None if card == NO_CARD else card))
+    return moves
+
+
+def _check_version(data):
+    if not is_packed(data):
+        raise ValueError('Unknown storage format version %r' % data[:1])
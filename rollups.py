@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+""" rollups.py - Cron and task handlers that roll up sharded counters. """
+
+import logging
+import webapp2
+from datetime import datetime, timedelta
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import User, StatShard, StatRollup, Leaderboard
+from models.leaderboard import RANKINGS, ranking_entry
+
+BATCH_SIZE = 100
+# Shards written just before a run may commit after it starts, so each
+# run also looks back this far into the previous one (rollup is idempotent)
+OVERLAP = timedelta(minutes=1)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class rollup_user_stats(webapp2.RequestHandler):
+    def get(self):
+        """
+        Start a rollup of users whose StatShards changed since the last
+        run: their wins, total_games and win_rate are recomputed from
+        the shards, so get_user_rankings sorts by current win_rate
+        Each run also merges the top of User.win_rate into the rankings
+        board, adding users it is missing (see leaderboard.py)
+        Called every 10 minutes using a cron job
+        """
+        Leaderboard.rebuild(RANKINGS)
+
+        @ndb.transactional
+        def start():
+            state = StatRollup.get_or_insert('user_stats')
+            params = {'until': format_time(datetime.now())}
+            if state.last_run:
+                params['since'] = format_time(state.last_run - OVERLAP)
+            state.last_run = datetime.now()
+            state.put()
+            taskqueue.add(url='/tasks/rollup_stats', params=params,
+                          transactional=True)
+        start()
+
+    def post(self):
+        """
+        Roll up users of one batch of changed StatShards and merge them
+        into the rankings board, then queue the next batch. Uses
+        appEngine Push Queue; a failed batch is retried from its cursor
+        """
+        q = StatShard.query(StatShard.updated <
+                            parse_time(self.request.get('until')))
+        if self.request.get('since'):
+            q = q.filter(StatShard.updated >=
+                         parse_time(self.request.get('since')))
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = Cursor(urlsafe=self.request.get('cursor'))
+        keys, next_cursor, more = q.fetch_page(BATCH_SIZE, keys_only=True,
+                                               start_cursor=cursor)
+        users = set(StatShard.user_of(key) for key in keys)
+        rolled_up = [User.rollup_stats(user) for user in users]
+        if rolled_up:
+            Leaderboard.update([RANKINGS],
+                               [ranking_entry(user) for user in rolled_up])
+        logging.info('Rolled up stats of %d users', len(users))
+        if more and next_cursor:
+            params = dict(self.request.params)
+            params['cursor'] = next_cursor.urlsafe()
+            taskqueue.add(url='/tasks/rollup_stats', params=params)
+
+
+def format_time(value):
+    """ Return datetime as task parameter """
+    return value.strftime(TIME_FORMAT)
+
+
+def parse_time(value):
+    """ Return datetime of task parameter """
+    return datetime.strptime(value, TIME_FORMAT)
+
+app = webapp2.WSGIApplication([
+    ('/crons/rollup_stats', rollup_user_stats),
+    ('/tasks/rollup_stats', rollup_user_stats),
+], debug=True)
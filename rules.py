@@ -0,0 +1,36 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# game rules shared by Game model and offline simulation for Straight_Gin_API
+#
+# Pure functions only (no ndb or endpoints), so simulate.py can play
+# exactly the same game as the API.
+
+TAKE_VISIBLE = '1'
+TAKE_HIDDEN = '2'
+
+# Codes of moves recorded in Game history
+MOVE_FIRST = 0
+MOVE_TOOK_VISIBLE = 1
+MOVE_TOOK_HIDDEN = 2
+MOVE_DISCARD = 3
+
+
+def winner_is_one(penalty_one, penalty_two, active_is_one, chosen):
+    """
+    Return True if player_one wins an ended game
+    penalty_one, penalty_two: deadwood penalty of each player's hand
+    active_is_one: True if player_one is the active player
+    chosen: True if active player chose to go "OUT",
+        False if game ended because no more cards to draw
+    """
+    # active player needs penalty of 0 to win by going "OUT"
+    if chosen:
+        if active_is_one:
+            return penalty_one == 0
+        return penalty_two != 0
+    # otherwise winner is player with lower penalty...
+    if penalty_one != penalty_two:
+        return penalty_one < penalty_two
+    # ...and penalty tie goes to active player
+    return active_is_one
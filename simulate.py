@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# headless self-play simulation for Straight_Gin_API
+#
+# Plays the same game as start_move/end_move and Game.end_game (shared
+# rules.py, deck.py, melds.py, computer.py) with no ndb or endpoints,
+# spread across a process pool. Aggregate results stream to JSONL, one
+# line per batch plus a final summary, including games/sec to catch
+# engine regressions.
+#
+# Example:
+#   python simulate.py --games 100000 --processes 4 --out results.jsonl
+#   python simulate.py --policy-one random --policy-two greedy
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import cards
+import computer
+import constants
+import melds
+from deck import Deck, SEED_BITS
+from lru import LRUCache
+from rules import TAKE_VISIBLE, TAKE_HIDDEN, winner_is_one
+
+# Deadwood penalties, memoized per worker process
+_CACHE = LRUCache(constants.HAND_CACHE_SIZE)
+
+
+def deadwood(hand):
+    """ Return deadwood penalty of hand (cached melds.deadwood) """
+    return _CACHE.get(hand, melds.deadwood)
+
+
+class RandomPolicy(object):
+    """ Draws and discards at random; goes "OUT" only with no deadwood """
+    def choose_draw(self, hand, draw_card, rng):
+        """ Return TAKE_VISIBLE or TAKE_HIDDEN """
+        return rng.choice((TAKE_VISIBLE, TAKE_HIDDEN))
+
+    def choose_discard(self, hand, rng):
+        """ Return card int to discard from hand """
+        return rng.choice(cards.mask_to_cards(hand))
+
+    def go_out(self, hand, rng):
+        """ Return True to go "OUT" with hand (after discard) """
+        return deadwood(hand) == 0
+
+
+class GreedyPolicy(RandomPolicy):
+    """
+    Plays like the server's computer opponent (computer.py): takes the
+    visible card only if it lowers deadwood, discards whichever card
+    leaves the least deadwood (no time budget)
+    """
+    def choose_draw(self, hand, draw_card, rng):
+        """ Return TAKE_VISIBLE or TAKE_HIDDEN """
+        return computer.choose_draw(hand, draw_card)
+
+    def choose_discard(self, hand, rng):
+        """ Return card int to discard from hand """
+        return computer.choose_discard(hand)[0]
+
+POLICIES = {
+    'random': RandomPolicy,
+    'greedy': GreedyPolicy,
+}
+
+
+def load_policy(name):
+    """
+    Return policy instance by registered name or 'module:Class' path
+    A policy provides choose_draw, choose_discard and go_out
+        (see RandomPolicy)
+    """
+    if name in POLICIES:
+        return POLICIES[name]()
+    module_name, _, class_name = name.partition(':')
+    if not class_name:
+        raise ValueError('Unknown policy %r' % name)
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def play_game(seed, policies, hand_size, max_turns, rng):
+    """
+    Play one game to the end; return dict describing the result
+    seed: deck seed
+    policies: (player_one policy, player_two policy)
+    hand_size: cards dealt to each player
+    max_turns: turns after which the game is abandoned as stalled
+        (taking the visible card never empties the deck)
+    rng: random.Random for the policies
+    """
+    deck = Deck(seed)
+    hands = [deck.deal(hand_size), deck.deal(hand_size)]
+    draw_card = deck.deal(1)
+    active = 0
+    chosen = False
+    turns = 0
+    while True:
+        if turns >= max_turns:
+            return {'ended_by': 'stalled', 'turns': turns}
+        policy = policies[active]
+        # start_move
+        if policy.choose_draw(hands[active], draw_card, rng) == TAKE_VISIBLE:
+            hands[active] |= draw_card
+        else:
+            card = deck.deal(1)
+            # out of cards, game automatically ends
+            if card is None:
+                break
+            hands[active] |= card
+        # end_move
+        discard = policy.choose_discard(hands[active], rng)
+        hands[active] &= ~(1 << discard)
+        draw_card = 1 << discard
+        turns += 1
+        if policy.go_out(hands[active], rng):
+            chosen = True
+            break
+        active ^= 1
+
+    penalties = [deadwood(hands[0]), deadwood(hands[1])]
+    winner = 0 if winner_is_one(penalties[0], penalties[1],
+                                active == 0, chosen) else 1
+    if not chosen:
+        ended_by = 'deck'
+    elif winner == active:
+        ended_by = 'out'
+    else:
+        ended_by = 'failed_out'
+    return {'ended_by': ended_by,
+            'turns': turns,
+            'winner': winner,
+            'penalty_winner': penalties[winner],
+            'penalty_loser': penalties[1 - winner]}
+
+
+class Tally(object):
+    """ Aggregate results of many games """
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0]
+        self.ended_by = {}
+        self.turns = {}
+        self.penalty_winner = {}
+        self.penalty_loser = {}
+
+    def add(self, result):
+        """ Count one play_game result """
+        self.games += 1
+        _bump(self.ended_by, result['ended_by'])
+        _bump(self.turns, result['turns'])
+        if 'winner' in result:
+            self.wins[result['winner']] += 1
+            _bump(self.penalty_winner, result['penalty_winner'])
+            _bump(self.penalty_loser, result['penalty_loser'])
+
+    def merge(self, other):
+        """ Add counts of another Tally """
+        self.games += other.games
+        self.wins = [a + b for a, b in zip(self.wins, other.wins)]
+        for mine, theirs in ((self.ended_by, other.ended_by),
+                             (self.turns, other.turns),
+                             (self.penalty_winner, other.penalty_winner),
+                             (self.penalty_loser, other.penalty_loser)):
+            for key, count in theirs.iteritems():
+                _bump(mine, key, count)
+
+    def to_dict(self):
+        """ Return JSON-ready summary """
+        decided = sum(self.wins)
+        total_turns = sum(t * n for t, n in self.turns.iteritems())
+        return {'games': self.games,
+                'win_rate_one': _ratio(self.wins[0], decided),
+                'win_rate_two': _ratio(self.wins[1], decided),
+                'ended_by': self.ended_by,
+                'mean_turns': _ratio(total_turns, self.games),
+                'turns': _histogram(self.turns),
+                'penalty_winner': _histogram(self.penalty_winner),
+                'penalty_loser': _histogram(self.penalty_loser)}
+
+
+def _bump(counts, key, count=1):
+    counts[key] = counts.get(key, 0) + count
+
+
+def _ratio(part, whole):
+    return float(part) / whole if whole else 0.0
+
+
+def _histogram(counts):
+    """ Return histogram with string keys (JSON object keys) """
+    return dict((str(key), counts[key]) for key in sorted(counts))
+
+
+def run_batch(task):
+    """
+    Play one batch of games in a worker; return (batch index, Tally)
+    Each batch has its own RNG stream derived from (seed, batch index),
+        so results don't depend on which worker runs which batch
+    """
+    index, games, seed, policy_names, hand_size, max_turns = task
+    rng = random.Random((seed << 32) + index)
+    policies = [load_policy(name) for name in policy_names]
+    tally = Tally()
+    for _ in xrange(games):
+        tally.add(play_game(rng.getrandbits(SEED_BITS), policies,
+                            hand_size, max_turns, rng))
+    return index, tally
+
+
+def simulate(games, batch_size, processes, seed, policy_names, hand_size,
+             max_turns, out):
+    """
+    Play "games" games across a process pool, writing one JSONL line to
+        "out" per finished batch and a summary line at the end
+    Return overall Tally
+    """
+    tasks = []
+    for index, start in enumerate(xrange(0, games, batch_size)):
+        tasks.append((index, min(batch_size, games - start), seed,
+                      policy_names, hand_size, max_turns))
+    total = Tally()
+    started = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for index, tally in pool.imap_unordered(run_batch, tasks):
+            total.merge(tally)
+            line = tally.to_dict()
+            line.update(_progress('batch', total.games, started))
+            line['batch'] = index
+            out.write(json.dumps(line, sort_keys=True) + '\n')
+            out.flush()
+    finally:
+        pool.close()
+        pool.join()
+    summary = total.to_dict()
+    summary.update(_progress('summary', total.games, started))
+    summary.update({'seed': seed,
+                    'policies': policy_names,
+                    'hand_size': hand_size,
+                    'processes': processes})
+    out.write(json.dumps(summary, sort_keys=True) + '\n')
+    out.flush()
+    return total
+
+
+def _progress(kind, games_done, started):
+    elapsed = time.time() - started
+    return {'type': kind,
+            'games_done': games_done,
+            'elapsed': round(elapsed, 3),
+            'games_per_sec': round(_ratio(games_done, elapsed), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Straight Gin self-play')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--hand-size', type=int, default=constants.HAND_SIZE)
+    parser.add_argument('--policy-one', default='greedy')
+    parser.add_argument('--policy-two', default='greedy')
+    parser.add_argument('--max-turns', type=int, default=500)
+    parser.add_argument('--out', default='-',
+                        help='JSONL output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'a')
+    try:
+        simulate(args.games, args.batch_size, args.processes, args.seed,
+                 [args.policy_one, args.policy_two], args.hand_size,
+                 args.max_turns, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
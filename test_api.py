@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# Tests of the StraightGinAPI game flow
+#
+# Each test calls the real StraightGinAPI methods against App Engine
+# testbed stubs (see testing.py). Needs the App Engine SDK:
+#   APPENGINE_SDK=~/google_appengine python -m unittest test_api
+
+import unittest
+
+from testing import sdk_available, start_testbed
+
+SDK_AVAILABLE = sdk_available()
+
+
+@unittest.skipUnless(SDK_AVAILABLE, 'App Engine SDK not found (APPENGINE_SDK)')
+class GameFlowTest(unittest.TestCase):
+    def setUp(self):
+        self.bed = start_testbed()
+        from api import StraightGinAPI, USER_REQUEST
+        self.api = StraightGinAPI()
+        for name in ('one', 'two'):
+            self.api.create_user(USER_REQUEST.combined_message_class(
+                user_name=name))
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def new_game(self):
+        """ Return GameForm of a new game of one against two """
+        from api import NEW_GAME_REQUEST
+        return self.api.new_game(NEW_GAME_REQUEST.combined_message_class(
+            player_one='one', player_two='two'))
+
+    def moves_of(self, game):
+        """ Return Moves logged for game (a GameForm), in order """
+        from google.appengine.ext import ndb
+        from models import Move
+        return Move.log_query(ndb.Key(urlsafe=game.urlsafe_key)).fetch()
+
+    def test_new_game(self):
+        game = self.new_game()
+        self.assertEqual(game.active_player, 'one')
+        self.assertFalse(game.game_over)
+        # the game's first move is logged as a child of the stored Game
+        moves = self.moves_of(game)
+        self.assertEqual([move.key.id() for move in moves], [1])
+
+    def test_turn_appends_to_move_log(self):
+        from api import GET_GAME_REQUEST, MOVE_REQUEST
+        from rules import TAKE_HIDDEN
+        game = self.new_game()
+        hand = self.api.start_move(MOVE_REQUEST.combined_message_class(
+            urlsafe_game_key=game.urlsafe_key, user_name='one',
+            move=TAKE_HIDDEN))
+        game = self.api.end_move(MOVE_REQUEST.combined_message_class(
+            urlsafe_game_key=game.urlsafe_key, user_name='one',
+            move=hand.hand.split()[0]))
+        self.assertEqual(game.active_player, 'two')
+        moves = self.moves_of(game)
+        self.assertEqual([move.key.id() for move in moves], [1, 2, 3])
+        history = self.api.get_game_history(
+            GET_GAME_REQUEST.combined_message_class(
+                urlsafe_game_key=game.urlsafe_key)).history
+        self.assertEqual(len(history.split('; ')), 3)
+
+    def test_active_games_lists_games_in_progress(self):
+        from api import GET_GAME_REQUEST, USER_NAME_REQUEST
+        games = [self.new_game() for _ in xrange(3)]
+        self.api.cancel_game(GET_GAME_REQUEST.combined_message_class(
+            urlsafe_game_key=games[1].urlsafe_key))
+        hands = self.api.get_active_games(
+            USER_NAME_REQUEST.combined_message_class(user_name='two')).items
+        self.assertEqual(sorted(hand.urlsafe_key for hand in hands),
+                         sorted([games[0].urlsafe_key, games[2].urlsafe_key]))
+
+    def test_cache_lookups_counted_per_call(self):
+        import instrumentation
+        from api import GET_GAME_VERSION_REQUEST
+        from google.appengine.api import memcache
+        game = self.new_game()
+        request = GET_GAME_VERSION_REQUEST.combined_message_class(
+            urlsafe_game_key=game.urlsafe_key)
+        # new_game wrote the Game through to memcache
+        with instrumentation.collect() as stats:
+            self.api.get_game(request)
+        self.assertEqual(stats.to_dict()['caches'],
+                         {'game_cache': {'hits': 1}})
+        memcache.flush_all()
+        with instrumentation.collect() as stats:
+            self.api.get_game(request)
+        self.assertEqual(stats.to_dict()['caches'],
+                         {'game_cache': {'misses': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# Tests of the reminder and move alert e-mail tasks (emails.py)
+#
+# The cron and task handlers run against App Engine testbed stubs (see
+# testing.py). Needs the App Engine SDK:
+#   APPENGINE_SDK=~/google_appengine python -m unittest test_emails
+
+import unittest
+
+from testing import sdk_available, start_testbed
+
+SDK_AVAILABLE = sdk_available()
+
+
+@unittest.skipUnless(SDK_AVAILABLE, 'App Engine SDK not found (APPENGINE_SDK)')
+class ReminderTest(unittest.TestCase):
+    def setUp(self):
+        self.bed = start_testbed()
+        import emails
+        from api import StraightGinAPI, NEW_GAME_REQUEST, USER_REQUEST
+        api = StraightGinAPI()
+        names = ['one', 'two', 'three', 'four']
+        for name in names:
+            api.create_user(USER_REQUEST.combined_message_class(
+                user_name=name, email=name + '@example.com'))
+        for one, two in zip(names[::2], names[1::2]):
+            api.new_game(NEW_GAME_REQUEST.combined_message_class(
+                player_one=one, player_two=two))
+        # one e-mail per send task
+        self.mail_batch_size = emails.MAIL_BATCH_SIZE
+        emails.MAIL_BATCH_SIZE = 1
+
+    def tearDown(self):
+        import emails
+        emails.MAIL_BATCH_SIZE = self.mail_batch_size
+        self.bed.deactivate()
+
+    def run_task(self, task):
+        """ Run queued task (a dict of taskqueue stub) by its handler """
+        import emails
+        import urlparse
+        import webapp2
+        params = dict(urlparse.parse_qsl(task['body'].decode('base64')))
+        request = webapp2.Request.blank(task['url'], POST=params)
+        response = request.get_response(emails.app)
+        self.assertEqual(response.status_int, 200)
+
+    def run_queue(self):
+        """ Run queued tasks (and those they queue) until none are left;
+            return the tasks run """
+        queue = self.bed.get_stub('taskqueue')
+        done = []
+        while True:
+            tasks = queue.GetTasks('default')
+            if not tasks:
+                return done
+            queue.FlushQueue('default')
+            for task in tasks:
+                self.run_task(task)
+                done.append(task)
+
+    def sent(self):
+        """ Return addresses of e-mails sent so far """
+        return [message.to for message in
+                self.bed.get_stub('mail').get_sent_messages()]
+
+    def play_turns(self, api, games, name):
+        """ Play one turn of user name in each of games """
+        from api import MOVE_REQUEST
+        from rules import TAKE_HIDDEN
+        for game in games:
+            urlsafe = game.key.urlsafe()
+            hand = api.start_move(MOVE_REQUEST.combined_message_class(
+                urlsafe_game_key=urlsafe, user_name=name, move=TAKE_HIDDEN))
+            api.end_move(MOVE_REQUEST.combined_message_class(
+                urlsafe_game_key=urlsafe, user_name=name,
+                move=hand.hand.split()[0]))
+
+
+    def test_each_player_reminded_once(self):
+        import emails
+        import webapp2
+        webapp2.Request.blank('/crons/reminders').get_response(emails.app)
+        self.run_queue()
+        self.assertEqual(sorted(self.sent()),
+                         sorted(name + '@example.com' for name in
+                                ('one', 'two', 'three', 'four')))
+
+    def test_retried_send_task_sends_nothing(self):
+        import emails
+        import webapp2
+        queue = self.bed.get_stub('taskqueue')
+        webapp2.Request.blank('/crons/reminders').get_response(emails.app)
+        # run the scan, then the first send task
+        while not self.sent():
+            task = queue.GetTasks('default')[0]
+            queue.FlushQueue('default')
+            self.run_task(task)
+        # the send task is retried after it committed, before the next
+        # batch runs: it must not e-mail that batch's players
+        self.run_task(task)
+        self.run_queue()
+        self.assertEqual(sorted(self.sent()),
+                         sorted(name + '@example.com' for name in
+                                ('one', 'two', 'three', 'four')))
+
+    def test_move_alerts_sent_as_one_digest(self):
+        import constants
+        from api import StraightGinAPI, NEW_GAME_REQUEST
+        from models import User, Game, PendingAlert
+        api = StraightGinAPI()
+        api.new_game(NEW_GAME_REQUEST.combined_message_class(
+            player_one='one', player_two='two'))
+        one = User.by_name('one').key
+        # both moves fall in one window: one task, one e-mail
+        window = constants.MOVE_ALERT_WINDOW
+        constants.MOVE_ALERT_WINDOW = 24 * 3600
+        try:
+            self.play_turns(api, Game.query(Game.players == one), 'one')
+        finally:
+            constants.MOVE_ALERT_WINDOW = window
+        self.assertEqual(len(self.run_queue()), 1)
+        messages = self.bed.get_stub('mail').get_sent_messages()
+        self.assertEqual([message.to for message in messages],
+                         ['two@example.com'])
+        self.assertIn('2 game(s)', messages[0].body.decode())
+        self.assertEqual(PendingAlert.query().count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# RPC budgets of the main API flows of Straight_Gin_API
+#
+# Each flow calls the real StraightGinAPI method against App Engine
+# testbed stubs (see testing.py) inside instrumentation.rpc_budget, so
+# a change that adds a serial round-trip or a datastore RPC fails here.
+# The budgets are the ones documented in Design.md (usual path: warm
+# caches, no contention). Needs the App Engine SDK:
+#   APPENGINE_SDK=~/google_appengine python -m unittest test_rpc_budgets
+
+import collections
+import unittest
+
+from testing import sdk_available, start_testbed
+
+SDK_AVAILABLE = sdk_available()
+
+# Serial round-trips and datastore RPCs allowed per flow (see Design.md):
+# the measured counts, which should stay at or under each flow's count
+# before the parallel datastore calls (only start_move is over, by one)
+BUDGETS = {
+    'new_game': {'round_trips': 5, 'datastore': 2},
+    'start_move': {'round_trips': 9, 'datastore': 4},
+    'end_move': {'round_trips': 11, 'datastore': 4},
+    'make_move': {'round_trips': 11, 'datastore': 4},
+    'end_move_out': {'round_trips': 12, 'datastore': 7},
+    'make_move_out': {'round_trips': 12, 'datastore': 7},
+}
+
+
+@unittest.skipUnless(SDK_AVAILABLE, 'App Engine SDK not found (APPENGINE_SDK)')
+class RpcBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.bed = start_testbed()
+        from api import StraightGinAPI, USER_REQUEST
+        from google.appengine.ext import ndb
+        from models import User
+        self.api = StraightGinAPI()
+        for name in ('one', 'two'):
+            self.api.create_user(USER_REQUEST.combined_message_class(
+                user_name=name))
+            # warm the caches (name in memcache, User in ndb's memcache),
+            # as the players' earlier requests would have: the User put
+            # above is still in ndb's in-context cache, which would
+            # answer the lookup without filling memcache
+            ndb.get_context().clear_cache()
+            User.by_name(name)
+        # ndb waits on RPCs in flight together in dict order (by object
+        # address), so which ones overlap varied from run to run; waiting
+        # in the order they were made keeps the counts the same
+        from google.appengine.ext.ndb import eventloop
+        eventloop.get_event_loop().rpcs = collections.OrderedDict()
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def call(self, flow, method, request):
+        """
+        Return method(request), made as a new request (empty in-context
+            cache) within the budget of flow
+        """
+        from google.appengine.ext import ndb
+        from instrumentation import rpc_budget
+        ndb.get_context().clear_cache()
+        with rpc_budget(**BUDGETS[flow]):
+            return method(request)
+
+    def new_game(self):
+        """ Return GameForm of a new game of one against two """
+        from api import NEW_GAME_REQUEST
+        return self.call('new_game', self.api.new_game,
+                         NEW_GAME_REQUEST.combined_message_class(
+                             player_one='one', player_two='two'))
+
+    def discard_of(self, game, name):
+        """ Return a card of name's hand in game (as a string) """
+        from api import GET_HAND_REQUEST
+        hand = self.api.get_hand(GET_HAND_REQUEST.combined_message_class(
+            urlsafe_game_key=game.urlsafe_key, user_name=name))
+        return hand.hand.split()[0]
+
+    def test_new_game(self):
+        game = self.new_game()
+        self.assertEqual(game.active_player, 'one')
+
+    def test_start_and_end_move(self):
+        from api import MOVE_REQUEST
+        from rules import TAKE_HIDDEN
+        game = self.new_game()
+        hand = self.call('start_move', self.api.start_move,
+                         MOVE_REQUEST.combined_message_class(
+                             urlsafe_game_key=game.urlsafe_key,
+                             user_name='one', move=TAKE_HIDDEN))
+        self.assertTrue(hand.mid_move)
+        game = self.call('end_move', self.api.end_move,
+                         MOVE_REQUEST.combined_message_class(
+                             urlsafe_game_key=game.urlsafe_key,
+                             user_name='one', move=hand.hand.split()[0]))
+        self.assertEqual(game.active_player, 'two')
+
+    def test_make_move(self):
+        from api import MAKE_MOVE_REQUEST
+        from rules import TAKE_VISIBLE
+        game = self.new_game()
+        discard = self.discard_of(game, 'one')
+        turn = self.call('make_move', self.api.make_move,
+                         MAKE_MOVE_REQUEST.combined_message_class(
+                             urlsafe_game_key=game.urlsafe_key,
+                             user_name='one', draw=TAKE_VISIBLE,
+                             discard=discard, out=False))
+        self.assertFalse(turn.game.game_over)
+        self.assertEqual(turn.game.active_player, 'two')
+
+    def test_game_ending_make_move(self):
+        from api import MAKE_MOVE_REQUEST
+        from rules import TAKE_VISIBLE
+        game = self.new_game()
+        discard = self.discard_of(game, 'one')
+        # going out ends the game (won or, if the hand fails, lost)
+        turn = self.call('make_move_out', self.api.make_move,
+                         MAKE_MOVE_REQUEST.combined_message_class(
+                             urlsafe_game_key=game.urlsafe_key,
+                             user_name='one', draw=TAKE_VISIBLE,
+                             discard=discard, out=True))
+        self.assertTrue(turn.game.game_over)
+
+    def test_game_ending_end_move(self):
+        from api import MOVE_REQUEST
+        from rules import TAKE_VISIBLE
+        game = self.new_game()
+        hand = self.call('start_move', self.api.start_move,
+                         MOVE_REQUEST.combined_message_class(
+                             urlsafe_game_key=game.urlsafe_key,
+                             user_name='one', move=TAKE_VISIBLE))
+        game = self.call('end_move_out', self.api.end_move,
+                         MOVE_REQUEST.combined_message_class(
+                             urlsafe_game_key=game.urlsafe_key,
+                             user_name='one',
+                             move=hand.hand.split()[0] + ' OUT'))
+        self.assertTrue(game.game_over)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# Full Stack Nanodegree Project 4 - Straight Gin
+# Built by jennifer lyden on provided Tic-Tac-Toe template
+#
+# App Engine testbed set-up shared by the tests of Straight_Gin_API
+#
+# The tests call StraightGinAPI methods directly against testbed stubs
+# (local datastore, memcache, taskqueue, mail), so they need the App
+# Engine SDK: its path comes from APPENGINE_SDK, and tests are skipped if
+# it can't be imported.
+
+import os
+import sys
+
+
+def setup_sdk(path):
+    """ Put App Engine SDK (and its bundled libraries) on sys.path """
+    if path:
+        sys.path.insert(0, os.path.expanduser(path))
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+
+def sdk_available():
+    """ Return True if the App Engine SDK (APPENGINE_SDK) can be set up """
+    try:
+        setup_sdk(os.environ.get('APPENGINE_SDK'))
+    except ImportError:
+        return False
+    return True
+
+
+def start_testbed():
+    """ Return activated testbed with every stub the API uses """
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    # endpoints.api_server reads the app revision from the version id
+    bed.setup_env(current_version_id='testbed.1', overwrite=True)
+    # strongly consistent, so flows don't depend on chance
+    policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+        probability=1)
+    bed.init_datastore_v3_stub(consistency_policy=policy)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(
+        root_path=os.path.dirname(os.path.abspath(__file__)))
+    bed.init_app_identity_stub()
+    bed.init_mail_stub()
+    return bed
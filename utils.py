@@ -4,12 +4,25 @@
 # utility functions for Straight_Gin_API
 
 import logging
+import cards
 import constants
 import endpoints
+import instrumentation
+import melds
 import random
 from itertools import groupby
+from lru import LRUCache
+from google.appengine.api import datastore_errors
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 
+# Deadwood penalties of recently tested hands, keyed by card mask
+HAND_CACHE = LRUCache(constants.HAND_CACHE_SIZE,
+                      on_lookup=instrumentation.lookup_counter('hand_cache'))
+
+# Prefix of page tokens within a leaderboard (see board_page)
+BOARD_TOKEN = 'board:'
+
 
 def get_by_urlsafe(urlsafe, model):
     """
@@ -25,10 +38,23 @@ def get_by_urlsafe(urlsafe, model):
         exists.
     Raises:
         ValueError
-    This function is used verbatim from Tic-Tac-Toe Template
+    This function is adapted from Tic-Tac-Toe Template
+    """
+    entity = key_from_urlsafe(urlsafe).get()
+    if not entity:
+        return None
+    if not isinstance(entity, model):
+        raise ValueError('Incorrect Kind')
+    return entity
+
+
+def key_from_urlsafe(urlsafe):
+    """
+    Return ndb.Key from urlsafe key string (without fetching the entity)
+    Raises BadRequestException if the key String is malformed
     """
     try:
-        key = ndb.Key(urlsafe=urlsafe)
+        return ndb.Key(urlsafe=urlsafe)
     except TypeError:
         raise endpoints.BadRequestException('Invalid Key')
     except Exception, e:
@@ -37,37 +63,67 @@ def get_by_urlsafe(urlsafe, model):
         else:
             raise
 
-    entity = key.get()
-    if not entity:
-        return None
-    if not isinstance(entity, model):
-        raise ValueError('Incorrect Kind')
-    return entity
+
+def get_user_names(keys, names=None):
+    """
+    Return dict mapping User keys to user names, fetching every key not
+        already known with a single ndb.get_multi
+    keys: iterable of User keys (duplicates and None are fine)
+    names: optional request-scoped dict of known names, updated in place
+        and returned, so forms built for a whole result set share it
+    """
+    if names is None:
+        names = {}
+    missing = list(set(key for key in keys
+                       if key is not None and key not in names))
+    if missing:
+        for key, user in zip(missing, ndb.get_multi(missing)):
+            names[key] = user.name if user else None
+    return names
+
+
+def get_player_names(entities, names=None):
+    """
+    Return get_user_names for the players of every Game or Score in
+        entities (one ndb.get_multi for the whole result set)
+    """
+    return get_user_names((key for entity in entities
+                           for key in entity.user_keys()), names)
 
 
 def deal_hand(deal, deck):
     """
-    Return list of strings of quantity "deal"
-        and list of remaining strings in "deck"
+    Return mask of quantity "deal" cards
+        and mask of remaining cards in "deck"
     deal: positive integer
-    deck: list of strings
+    deck: mask of cards (see cards.py)
+    If deck holds fewer than "deal" cards, return None and deck unchanged
     """
-    hand = []
-    try:
-        for i in range(deal):
-            card = random.choice(deck)
-            hand.append(card)
-            deck.remove(card)
-        return hand, deck
-    except IndexError:
-        return None, [0]
+    remaining = cards.mask_to_cards(deck)
+    if len(remaining) < deal:
+        return None, deck
+    hand = cards.cards_to_mask(random.sample(remaining, deal))
+    return hand, deck & ~hand
 
 
 def test_hand(hand):
     """
     Calculate deadwood penalty of Straight_Gin hand
-    hand: list of strings
+    hand: mask of cards (see cards.py)
+    Return integer penalty of unplayable ("deadwood") cards in hand,
+        using the best possible arrangement of runs and sets
+    Results are kept in HAND_CACHE (a card mask is already order-independent)
+    """
+    return HAND_CACHE.get(hand, melds.deadwood)
+
+
+def greedy_test_hand(hand):
+    """
+    Calculate deadwood penalty of Straight_Gin hand the original way:
+        strip runs first, then sets, borrowing from the ends of long runs
+    hand: mask of cards (see cards.py)
     Return integer penalty of unplayable ("deadwood") cards in hand
+    Kept to compare against test_hand; can miss better arrangements
 
     Resources consulted:
     http://stackoverflow.com/questions/7352684/how-to-find-the-groups-of-consecutive-elements-from-an-array-in-numpy
@@ -115,48 +171,16 @@ def test_hand(hand):
 
 def clean_hand(hand):
     """
-    Remove '-' & face-card letters from human-readable card representations
-    Split hand by suit & strip suit-letters
+    Split hand by suit into card numbers (i.e. J = Jack = 11)
 
-    hand: list of strings
+    hand: mask of cards (see cards.py)
     Return list of lists, where each inner list includes cards of same suit
     """
-    clean_hand = []
-    for card in hand:
-        # remove - from card representation
-        strip_card = card.replace('-', '')
-        # if face card, replace with numerical equivalent (i.e. J = Jack = 11)
-        if ord(strip_card[1]) in xrange(ord('A'), ord('Z')+1):
-            # Keep letter for suit
-            number_card = strip_card[0]
-            # But change letter for face card (i.e. J for Jack) to number
-            number_card = number_card + constants.LIBRARY[strip_card[1]]
-            clean_hand.append(number_card)
-        # Just add non-face cards without transformation
-        else:
-            clean_hand.append(strip_card)
-
-    # set up variables
-    clubs = []
-    diamonds = []
-    hearts = []
-    spades = []
-    suits = [clubs, diamonds, hearts, spades]
-
-    for card in clean_hand:
-        if card[0] == 'C':
-            # add to club set, but strip letter from card representation
-            just_number = int(card[1:])
-            clubs.append(just_number)
-        elif card[0] == 'D':
-            just_number = int(card[1:])
-            diamonds.append(just_number)
-        elif card[0] == 'H':
-            just_number = int(card[1:])
-            hearts.append(just_number)
-        elif card[0] == 'S':
-            just_number = int(card[1:])
-            spades.append(just_number)
+    suits = []
+    for suit in xrange(len(cards.SUITS)):
+        ranks = cards.suit_ranks(hand, suit)
+        suits.append([rank + 1 for rank in xrange(cards.RANKS)
+                      if ranks >> rank & 1])
     return suits
 
 
@@ -248,6 +272,106 @@ def game_exists(game):
         return True
 
 
+def page_size_of(page_size):
+    """
+    Return page_size limited to constants.MAX_PAGE_SIZE
+        (constants.DEFAULT_PAGE_SIZE if None)
+    """
+    if page_size is None:
+        return constants.DEFAULT_PAGE_SIZE
+    elif page_size < 1:
+        raise endpoints.BadRequestException('page_size must be '
+                                            'greater than zero.')
+    return min(page_size, constants.MAX_PAGE_SIZE)
+
+
+def fetch_page(query, page_size=None, page_token=None, **options):
+    """
+    Return one page of query results and the token for the next page
+    query: ndb.Query (OR queries must be ordered by key last)
+    page_size: results per page (default constants.DEFAULT_PAGE_SIZE,
+        at most constants.MAX_PAGE_SIZE)
+    page_token: next_page_token from previous page, or None for first page
+    options: extra fetch options (i.e. projection)
+    Returns (list of entities, next_page_token or None if no more results)
+    """
+    page_size = page_size_of(page_size)
+    cursor = None
+    if page_token:
+        try:
+            cursor = Cursor(urlsafe=page_token)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException('Invalid page_token')
+    results, next_cursor, more = query.fetch_page(
+        page_size, start_cursor=cursor, **options)
+    if more and next_cursor:
+        return results, next_cursor.urlsafe()
+    return results, None
+
+
+def board_page(entries, query=None, key_field=None, page_size=None,
+               page_token=None, **options):
+    """
+    Return one page of a leaderboard and the token for the next page
+    entries: board entries, best first (see models/leaderboard.py)
+    query: query of the rows after the board (see Leaderboard.rest_query),
+        or None if the board is the whole list; it starts at the value of
+        the board's last entry, so ties with that entry already on the
+        board are skipped by key (key_field: entry field holding it)
+    Tokens within the board are 'board:<offset>'; later ones are cursors
+    Returns (list of entries and/or entities, next_page_token or None)
+    """
+    page_size = page_size_of(page_size)
+    if page_token and not page_token.startswith(BOARD_TOKEN):
+        if query is None:
+            raise endpoints.BadRequestException('Invalid page_token')
+        try:
+            cursor = Cursor(urlsafe=page_token)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException('Invalid page_token')
+        return _fetch_after_board(entries, query, key_field, page_size,
+                                  cursor, options)
+    offset = 0
+    if page_token:
+        try:
+            offset = int(page_token[len(BOARD_TOKEN):])
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid page_token')
+    page = entries[offset:offset + page_size]
+    end = offset + len(page)
+    if end < len(entries):
+        return page, BOARD_TOKEN + str(end)
+    if query is None:
+        return page, None
+    if len(page) == page_size:
+        return page, BOARD_TOKEN + str(end)
+    results, next_token = _fetch_after_board(entries, query, key_field,
+                                             page_size - len(page), None,
+                                             options)
+    return page + results, next_token
+
+
+def _fetch_after_board(entries, query, key_field, size, cursor, options):
+    """
+    Return (up to size results of query not on the board, next_page_token
+        or None); fetches again for each result skipped
+    """
+    on_board = set(entry[key_field] for entry in entries)
+    results = []
+    while len(results) < size:
+        try:
+            batch, cursor, more = query.fetch_page(
+                size - len(results), start_cursor=cursor, **options)
+        except datastore_errors.BadRequestError:
+            # board changed since the cursor was made
+            raise endpoints.BadRequestException('Expired page_token')
+        results += [entity for entity in batch
+                    if entity.key.urlsafe() not in on_board]
+        if not (more and cursor):
+            return results, None
+    return results, cursor.urlsafe()
+
+
 def limit_set(input):
     """
     Validate input for get_high_scores